@@ -0,0 +1,124 @@
+"""
+Synthetic ODC-style NetCDF tiles for the benchmarks.
+
+The tiles mimic the files produced by the datacube NetCDF writer: (time, y, x)
+variables on an EPSG:3577 grid described by a `crs` grid mapping variable, and
+a trailing `dataset` variable holding one YAML document per time slice.
+"""
+from datetime import datetime, timedelta
+
+import netCDF4
+import numpy as np
+import yaml
+from rasterio.crs import CRS
+
+ALBERS_EPSG = 3577
+PIXEL_SIZE = 25
+TILE_SIZE_METRES = 100000
+
+# Variables of a synthetic tile: name -> (dtype, nodata)
+VARIABLES = {
+    'BS': ('uint8', -1),            # Byte with a negative nodata, as in the fractional cover tiles
+    'PV': ('uint8', -1),
+    'blue': ('int16', -999),
+    'green': ('int16', -999),
+    'water': ('uint8', 1),
+}
+
+
+def tile_name(x, y, time, product='BENCH'):
+    """
+    File name of a tile, as understood by the 'whatever_{x}_{y}_{time}' source template
+    """
+    return f'{product}_{ALBERS_EPSG}_{x}_{y}_{time:%Y%m%d%H%M%S}_v1.nc'
+
+
+def _dataset_doc(variables, x, y, time, size):
+    left = x * TILE_SIZE_METRES
+    bottom = y * TILE_SIZE_METRES
+    right = left + size * PIXEL_SIZE
+    top = bottom + size * PIXEL_SIZE
+    return {
+        'id': f'00000000-0000-0000-0000-{time:%Y%m%d%H%M}',
+        'product_type': 'benchmark',
+        'extent': {'from_dt': time.isoformat(), 'to_dt': time.isoformat(), 'center_dt': time.isoformat()},
+        'grid_spatial': {'projection': {
+            'spatial_reference': f'EPSG:{ALBERS_EPSG}',
+            'geo_ref_points': {'ll': {'x': left, 'y': bottom}, 'lr': {'x': right, 'y': bottom},
+                               'ul': {'x': left, 'y': top}, 'ur': {'x': right, 'y': top}}}},
+        'image': {'bands': {name: {'layer': name, 'path': ''} for name in variables}},
+        'lineage': {'source_datasets': {}},
+    }
+
+
+def _pixels(rng, dtype, nodata, shape):
+    """
+    Spatially correlated values with some nodata, so that compression behaves realistically
+    """
+    info = np.iinfo(dtype)
+    low, high = max(info.min, 0), min(info.max, 10000)
+    coarse = rng.integers(low, high, size=(shape[0], shape[1] // 16 + 1, shape[2] // 16 + 1))
+    data = np.repeat(np.repeat(coarse, 16, axis=1), 16, axis=2)[:, :shape[1], :shape[2]]
+    data = data + rng.integers(0, 3, size=shape)
+    data = np.clip(data, low, high).astype(dtype)
+    fill = np.uint8(255) if dtype == 'uint8' and nodata < 0 else np.array(nodata).astype(dtype)
+    data[:, :shape[1] // 10, :] = fill
+    return data
+
+
+def make_tile(path, size=4000, timeslices=1, variables=None, x=15, y=-40, chunk=200, seed=0,
+              start=datetime(2018, 5, 6, 10, 20, 18), time_chunk=1):
+    """
+    Write a synthetic ODC-style NetCDF tile of size x size pixels and 'timeslices' time slices
+
+    The variables are chunked by 'chunk' pixels along both sides and 'time_chunk' time slices.
+    """
+    variables = variables or VARIABLES
+    rng = np.random.default_rng(seed)
+    times = [start + timedelta(days=16 * k) for k in range(timeslices)]
+    left = x * TILE_SIZE_METRES
+    top = y * TILE_SIZE_METRES + size * PIXEL_SIZE
+
+    with netCDF4.Dataset(path, 'w', format='NETCDF4') as nco:
+        nco.createDimension('time', timeslices)
+        nco.createDimension('y', size)
+        nco.createDimension('x', size)
+
+        var = nco.createVariable('time', 'f8', ('time',))
+        var.units = 'seconds since 1970-01-01 00:00:00'
+        var.calendar = 'standard'
+        var[:] = netCDF4.date2num(times, var.units, var.calendar)
+
+        var = nco.createVariable('y', 'f8', ('y',))
+        var.units = 'metre'
+        var.standard_name = 'projection_y_coordinate'
+        var[:] = top - PIXEL_SIZE * (np.arange(size) + 0.5)
+
+        var = nco.createVariable('x', 'f8', ('x',))
+        var.units = 'metre'
+        var.standard_name = 'projection_x_coordinate'
+        var[:] = left + PIXEL_SIZE * (np.arange(size) + 0.5)
+
+        crs = nco.createVariable('crs', 'i4')
+        crs.grid_mapping_name = 'albers_conical_equal_area'
+        crs.spatial_ref = CRS.from_epsg(ALBERS_EPSG).wkt
+        crs.GeoTransform = f'{left} {PIXEL_SIZE} 0 {top} 0 {-PIXEL_SIZE}'
+
+        for name, (dtype, nodata) in variables.items():
+            var = nco.createVariable(name, dtype, ('time', 'y', 'x'), zlib=True, complevel=4,
+                                     chunksizes=(min(time_chunk, timeslices), min(chunk, size), min(chunk, size)))
+            var.set_auto_maskandscale(False)
+            var.grid_mapping = 'crs'
+            # Written as an attribute, as netCDF4 refuses a _FillValue outside the dtype range
+            var.setncattr('nodata', nodata)
+            var.setncattr('missing_value', np.array(nodata, dtype='int16' if nodata < 0 else dtype))
+            var[:] = _pixels(rng, dtype, nodata, (timeslices, size, size))
+
+        docs = [yaml.safe_dump(_dataset_doc(variables, x, y, time, size)).encode('utf-8') for time in times]
+        nchar = max(len(doc) for doc in docs)
+        nco.createDimension('dataset_nchar', nchar)
+        var = nco.createVariable('dataset', 'S1', ('time', 'dataset_nchar'))
+        var.set_auto_chartostring(False)
+        var[:] = np.stack([np.frombuffer(doc.ljust(nchar, b'\0'), dtype='S1') for doc in docs])
+
+    return path, times
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the NetCDF to COG conversion and of the COG validation.
+
+`run` generates synthetic ODC-style NetCDF tiles (see fixtures.py) at several
+sizes, times each case a few times and saves the timings to
+benchmarks/results/<commit>.json. `compare` prints the change of the median
+times between two such files.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from os.path import join as pjoin, dirname, abspath
+
+import click
+import rasterio
+
+BENCH_DIR = dirname(abspath(__file__))
+REPO_DIR = dirname(BENCH_DIR)
+RESULTS_DIR = pjoin(BENCH_DIR, 'results')
+sys.path[:0] = [pjoin(REPO_DIR, 'streamer'), REPO_DIR]
+
+import timing                                   # noqa: E402
+import validate_cog_header                      # noqa: E402
+from cogeo import cog_translate, cog_translate_many    # noqa: E402
+from fixtures import VARIABLES, make_tile, tile_name   # noqa: E402
+
+CASES = ['convert', 'translate', 'translate_streaming', 'translate_many', 'translate_many_unstacked', 'validate_header',
+         'validate_gdal', 'make_out_prefix']
+
+# Same creation options as COGNetCDF
+PROFILE = {'driver': 'GTiff',
+           'interleave': 'pixel',
+           'tiled': True,
+           'blockxsize': 512,
+           'blockysize': 512,
+           'compress': 'DEFLATE',
+           'predictor': 2,
+           'zlevel': 9}
+
+# Calls per repeat of the cases too quick to time one by one
+VALIDATE_CALLS = 100
+PREFIX_CALLS = 10000
+
+
+def _git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                         universal_newlines=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                        universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '-dirty' if dirty else commit
+
+
+def _import_converter():
+    """
+    COGNetCDF, or None where its dependencies (GDAL bindings, datacube) are not installed
+    """
+    try:
+        from streamer import COGNetCDF
+    except ImportError as e:
+        click.echo(f'Skipping the COGNetCDF cases: {e}', err=True)
+        return None
+    return COGNetCDF
+
+
+def _timed(func, repeat):
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        walls.append(time.perf_counter() - start)
+    return walls
+
+
+def _stage_walls(metrics_file):
+    """
+    Wall times of the stage records written to 'metrics_file', by stage name, and clear it
+    """
+    walls = {}
+    with open(metrics_file) as fd:
+        for line in fd:
+            record = json.loads(line)
+            walls.setdefault(record['stage'], []).append(record['wall'])
+    os.remove(metrics_file)
+    return walls
+
+
+def _summary(walls, **fields):
+    fields.update({'times': walls,
+                   'median': statistics.median(walls),
+                   'min': min(walls)})
+    return fields
+
+
+def _bench_tile(tile, size, timeslices, repeat, workdir, cases, converter):
+    """
+    Run the cases selected in 'cases' on one tile, and return their results by name
+    """
+    results = {}
+    key = f'{size}px_{timeslices}t'
+    metrics_file = pjoin(workdir, 'stages.jsonl')
+    with rasterio.open(tile) as ds:
+        subdatasets = [sub for sub in ds.subdatasets if not sub.endswith(':dataset')]
+
+    def band_path(name):
+        return pjoin(workdir, f'{name}.tif')
+
+    if 'convert' in cases and converter is not None:
+        def convert():
+            out_dir = tempfile.mkdtemp(dir=workdir)
+            converter()(tile, out_dir)
+        results[f'convert/{key}'] = _summary(_timed(convert, repeat), size=size, timeslices=timeslices)
+
+    for case, streaming in (('translate', False), ('translate_streaming', True)):
+        if case not in cases:
+            continue
+        for sub in subdatasets:
+            name = sub.split(':')[-1]
+            timing.configure(metrics_file=metrics_file)
+            walls = _timed(lambda: cog_translate(sub, band_path(name), PROFILE, indexes=[1],
+                                                 overview_resampling='average',
+                                                 streaming_overviews=streaming), repeat)
+            timing.configure()
+            results[f'{case}/{name}/{key}'] = _summary(walls, size=size, timeslices=timeslices)
+            # Break-down of cog_translate from its timing stages
+            for stage_name, stage_walls in _stage_walls(metrics_file).items():
+                results[f'{case}:{stage_name}/{name}/{key}'] = _summary(stage_walls, size=size,
+                                                                        timeslices=timeslices)
+
+    for case, stack_reads in (('translate_many', True), ('translate_many_unstacked', False)):
+        if case not in cases:
+            continue
+        bands = [{'src': sub,
+                  'indexes': [i + 1],
+                  'dst_path': pjoin(workdir, f'{sub.split(":")[-1]}_{i + 1}.tif'),
+                  'dst_kwargs': PROFILE,
+                  'overview_resampling': 'average'}
+                 for sub in subdatasets for i in range(timeslices)]
+        walls = _timed(lambda: cog_translate_many(bands, stack_reads=stack_reads), repeat)
+        results[f'{case}/{key}'] = _summary(walls, size=size, timeslices=timeslices, outputs=len(bands))
+
+    if 'validate_header' in cases or 'validate_gdal' in cases:
+        cog = band_path('validate')
+        cog_translate(subdatasets[-1], cog, PROFILE, indexes=[1], overview_resampling='average')
+        validators = {'validate_header': validate_cog_header}
+        if 'validate_gdal' in cases:
+            try:
+                import validate_cloud_optimized_geotiff
+                validators['validate_gdal'] = validate_cloud_optimized_geotiff
+            except ImportError as e:
+                click.echo(f'Skipping the validate_gdal case: {e}', err=True)
+        for case, validator in validators.items():
+            if case not in cases:
+                continue
+
+            def validate():
+                for _ in range(VALIDATE_CALLS):
+                    validator.validate(cog)
+            walls = [wall / VALIDATE_CALLS for wall in _timed(validate, repeat)]
+            results[f'{case}/{key}'] = _summary(walls, size=size, timeslices=timeslices)
+
+    return results
+
+
+def _bench_out_prefix(converter, repeat, workdir):
+    """
+    Time COGNetCDF._make_out_prefix on the names of a year of tiles
+    """
+    names = [tile_name(x, y, datetime(2018, 1, 1) + timedelta(days=day))
+             for x, y, day in zip(range(PREFIX_CALLS), range(PREFIX_CALLS), range(0, PREFIX_CALLS * 7, 7))]
+    out_dir = pjoin(workdir, 'prefix')
+
+    def make_prefixes():
+        cog_netcdf = converter()
+        for name in names:
+            cog_netcdf._make_out_prefix(name, out_dir)
+    walls = [wall / PREFIX_CALLS for wall in _timed(make_prefixes, repeat)]
+    return {'make_out_prefix': _summary(walls, calls=PREFIX_CALLS)}
+
+
+def _environment():
+    return {'python': platform.python_version(),
+            'rasterio': rasterio.__version__,
+            'gdal': rasterio.__gdal_version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+@click.group(help=__doc__)
+def cli():
+    pass
+
+
+@cli.command(help='Time the benchmark cases and save the results')
+@click.option('--sizes', default='1000,2000,4000', show_default=True,
+              help='Comma separated tile sizes (pixels along a side)')
+@click.option('--timeslices', default='1,4', show_default=True,
+              help='Comma separated numbers of time slices per tile')
+@click.option('--time-chunk', type=int, default=1, show_default=True,
+              help='Time slices per NetCDF chunk of the tiles')
+@click.option('--repeat', '-r', type=int, default=3, show_default=True, help='Timed runs of each case')
+@click.option('--case', '-c', 'cases', type=click.Choice(CASES), multiple=True,
+              help='Run only these cases (default: all)')
+@click.option('--workdir', type=click.Path(file_okay=False, writable=True),
+              help='Where the tiles and outputs are written (default: a temporary directory)')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True),
+              help='Results file (default: benchmarks/results/<commit>.json)')
+def run(sizes, timeslices, time_chunk, repeat, cases, workdir, output):
+    cases = set(cases or CASES)
+    commit = _git_commit()
+    converter = _import_converter() if cases & {'convert', 'make_out_prefix'} else None
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = pjoin(RESULTS_DIR, f'{commit}.json')
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmpdir:
+        for size in (int(size) for size in sizes.split(',')):
+            for count in (int(count) for count in timeslices.split(',')):
+                tile_dir = tempfile.mkdtemp(dir=tmpdir)
+                tile, times = make_tile(pjoin(tile_dir, tile_name(15, -40, datetime(2018, 5, 6, 10, 20, 18))),
+                                        size=size, timeslices=count, variables=VARIABLES, time_chunk=time_chunk)
+                click.echo(f'{size}x{size} pixels, {count} time slice(s): {os.path.getsize(tile)} bytes', err=True)
+                results.update(_bench_tile(tile, size, count, repeat, tile_dir, cases, converter))
+        if 'make_out_prefix' in cases and converter is not None:
+            results.update(_bench_out_prefix(converter, repeat, tmpdir))
+
+    for name, result in sorted(results.items()):
+        click.echo(f'{name:<56} {result["median"]:12.6f}s')
+
+    with open(output, 'w') as fd:
+        json.dump({'commit': commit,
+                   'time': datetime.now().isoformat(),
+                   'environment': _environment(),
+                   'repeat': repeat,
+                   'results': results}, fd, indent=2)
+    click.echo(f'Results saved to {output}', err=True)
+
+
+@cli.command(help='Compare the median times of two results files')
+@click.argument('base', type=click.Path(exists=True, dir_okay=False))
+@click.argument('new', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', type=float, default=0.1, show_default=True,
+              help='Relative slowdown reported as a regression')
+def compare(base, new, threshold):
+    with open(base) as fd:
+        base = json.load(fd)
+    with open(new) as fd:
+        new = json.load(fd)
+
+    click.echo(f'{"case":<56} {base["commit"]:>12} {new["commit"]:>12} {"change":>8}')
+    regressions = 0
+    for name in sorted(set(base['results']) | set(new['results'])):
+        before = base['results'].get(name, {}).get('median')
+        after = new['results'].get(name, {}).get('median')
+        if before is None or after is None:
+            click.echo(f'{name:<56} {before or "-":>12} {after or "-":>12}')
+            continue
+        change = after / before - 1 if before > 0 else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  slower'
+            regressions += 1
+        elif change < -threshold:
+            flag = '  faster'
+        click.echo(f'{name:<56} {before:12.6f} {after:12.6f} {change:+8.1%}{flag}')
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,119 @@
+"""
+Sample-based comparison of compression codecs.
+
+Blocks sampled at random from the variables of some input NetCDF files are
+encoded as single-tile GeoTIFFs in memory with each candidate codec, then
+decoded again. The encode and decode times, the compressed size and the
+largest decoding error (for LERC) are summed per band name and candidate, to
+pick the codec settings of each band of a product.
+"""
+import time
+
+import numpy
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
+
+BLOCK_SIZE = 512
+
+
+def parse_candidate(text):
+    """
+    Arguments of cogeo.compression_options for a candidate written as CODEC[:LEVEL], e.g. 'ZSTD:9' or 'LERC:0.5'
+    """
+    compress, _, level = text.partition(':')
+    codec = {'compress': compress.upper()}
+    if level:
+        codec['level'] = float(level) if '.' in level else int(level)
+    return codec
+
+
+def sample_blocks(path, samples, rng, band_filter=None):
+    """
+    Yield (band name, block, nodata) for 'samples' random blocks of each variable of a NetCDF file
+    """
+    with rasterio.open(path) as ds:
+        # The last subdataset holds the dataset documents
+        subdatasets = ds.subdatasets[:-1]
+
+    for subdataset in subdatasets:
+        band_name = subdataset.split(':')[-1]
+        if band_filter is not None and not band_filter(band_name):
+            continue
+        with rasterio.open(subdataset) as src:
+            nodata = src.nodata
+            for _ in range(samples):
+                width, height = min(BLOCK_SIZE, src.width), min(BLOCK_SIZE, src.height)
+                window = Window(int(rng.integers(0, src.width - width + 1)),
+                                int(rng.integers(0, src.height - height + 1)), width, height)
+                block = src.read(int(rng.integers(1, src.count + 1)), window=window)
+                if block.dtype == 'uint8' and nodata is not None and nodata < 0:
+                    # Promoted as cog_translate does
+                    block = numpy.where(block == 255, nodata, block).astype('int16')
+                yield band_name, block, nodata
+
+
+def encode_decode(block, nodata, options):
+    """
+    Encode a block with the given compression creation options and decode it again
+
+    Returns the encode and decode times, the encoded size, and the largest absolute decoding error.
+    """
+    profile = {'driver': 'GTiff',
+               'width': block.shape[1],
+               'height': block.shape[0],
+               'count': 1,
+               'dtype': block.dtype,
+               'nodata': nodata,
+               'tiled': True,
+               'blockxsize': BLOCK_SIZE,
+               'blockysize': BLOCK_SIZE}
+    profile.update(options)
+
+    with MemoryFile() as memfile:
+        start = time.perf_counter()
+        with memfile.open(**profile) as dst:
+            dst.write(block, 1)
+        encode = time.perf_counter() - start
+        size = memfile.getbuffer().nbytes
+
+        start = time.perf_counter()
+        with memfile.open() as src:
+            decoded = src.read(1)
+        decode = time.perf_counter() - start
+
+    # Nodata NaNs are left out
+    diff = numpy.abs(decoded.astype('float64') - block)
+    error = float(diff[numpy.isfinite(diff)].max(initial=0.0))
+    return encode, decode, size, error
+
+
+def autotune(paths, candidates, samples=8, band_filter=None, seed=0):
+    """
+    Measure each candidate codec on blocks sampled from 'paths'
+
+    'candidates' maps a candidate name to its compression creation options
+    (see cogeo.compression_options). Returns {band name: {candidate name: totals}}.
+    """
+    rng = numpy.random.default_rng(seed)
+    report = {}
+    for path in paths:
+        for band_name, block, nodata in sample_blocks(path, samples, rng, band_filter):
+            for name, options in candidates.items():
+                encode, decode, size, error = encode_decode(block, nodata, options)
+                totals = report.setdefault(band_name, {}).setdefault(name, {
+                    'options': options, 'blocks': 0, 'raw_bytes': 0, 'encoded_bytes': 0,
+                    'encode_seconds': 0.0, 'decode_seconds': 0.0, 'max_error': 0.0})
+                totals['blocks'] += 1
+                totals['raw_bytes'] += block.nbytes
+                totals['encoded_bytes'] += size
+                totals['encode_seconds'] += encode
+                totals['decode_seconds'] += decode
+                totals['max_error'] = max(totals['max_error'], error)
+
+    for band in report.values():
+        for totals in band.values():
+            totals['ratio'] = totals['raw_bytes'] / totals['encoded_bytes']
+            totals['encode_mb_per_sec'] = totals['raw_bytes'] / totals['encode_seconds'] / 1024 ** 2
+            totals['decode_mb_per_sec'] = totals['raw_bytes'] / totals['decode_seconds'] / 1024 ** 2
+    return report
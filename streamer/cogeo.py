@@ -2,16 +2,517 @@
 
 import os
 import sys
+import tempfile
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
 
 import click
 
 import numpy
 
-import gdal
 import rasterio
 from rasterio.io import MemoryFile
 from rasterio.enums import Resampling
 from rasterio.shutil import copy
+from rasterio.windows import Window
+
+from fileio import replacing
+from timing import stage
+
+# Rasters (overviews included) at least this large are staged in a scratch file
+IN_MEMORY_THRESHOLD = 512 * 1024 ** 2
+
+# Source rows buffered at once by all the readers of a sweep together (see _SourceReader.read)
+STRIP_BUFFER_LIMIT = 64 * 1024 ** 2
+
+# Overview resampling methods that can be built while the blocks are written
+STREAMING_RESAMPLING = ("average", "nearest", "mode")
+
+# Creation option setting the level of each codec
+COMPRESSION_LEVEL_OPTIONS = {
+    "DEFLATE": "zlevel",
+    "ZSTD": "zstd_level",
+    "LZMA": "lzma_preset",
+    "LERC_DEFLATE": "zlevel",
+    "LERC_ZSTD": "zstd_level",
+}
+
+# Codecs taking a predictor
+PREDICTOR_CODECS = ("DEFLATE", "ZSTD", "LZMA", "LZW")
+
+
+def compression_options(compress="DEFLATE", level=None, predictor=None, max_z_error=None):
+    """
+    GTiff creation options of a codec, e.g. ("ZSTD", 9, 2) -> compress=ZSTD, zstd_level=9, predictor=2.
+
+    The level of LERC is its maximum error (0 for lossless); that of
+    LERC_DEFLATE and LERC_ZSTD is the level of their second stage, and their
+    maximum error is given by max_z_error. The predictor is dropped for the
+    codecs which do not take one.
+    """
+    compress = compress.upper()
+    options = {"compress": compress}
+    if level is not None:
+        if compress == "LERC":
+            max_z_error = level
+        elif compress in COMPRESSION_LEVEL_OPTIONS:
+            options[COMPRESSION_LEVEL_OPTIONS[compress]] = level
+        else:
+            raise ValueError("{} does not take a compression level".format(compress))
+    if max_z_error is not None and compress.startswith("LERC"):
+        options["max_z_error"] = max_z_error
+    if predictor is not None and compress in PREDICTOR_CODECS:
+        options["predictor"] = predictor
+    return options
+
+
+def merge_codecs(codec, band_codec=None):
+    """
+    Codec of a band, from the default codec and the settings overriding it for that band.
+
+    Both are dicts of compression_options arguments. The default level is only
+    kept if the band keeps the default compression, as levels are specific to
+    a codec.
+    """
+    merged = dict(codec)
+    if band_codec:
+        if "compress" in band_codec and band_codec["compress"].upper() != str(codec.get("compress")).upper():
+            merged["level"] = None
+        merged.update(band_codec)
+    return merged
+
+
+def _raster_nbytes(meta, overview_level=5):
+    """Estimate the size in bytes of a raster and its overviews."""
+    nbytes = meta["width"] * meta["height"] * meta["count"] * numpy.dtype(meta["dtype"]).itemsize
+    return sum(nbytes // 4 ** j for j in range(overview_level + 1))
+
+
+@contextmanager
+def _temporary_dataset(meta, in_memory=True, temp_dir=None):
+    """
+    Open a writable temporary raster, either in memory or in a scratch directory.
+
+    Scratch files keep at most GDAL_CACHEMAX of dirty blocks in memory, so the
+    memory ceiling does not depend on the raster size.
+    """
+    if in_memory:
+        with MemoryFile() as memfile:
+            with memfile.open(**meta) as mem:
+                yield mem
+    else:
+        with tempfile.TemporaryDirectory(dir=temp_dir) as tmpdir:
+            with rasterio.open(os.path.join(tmpdir, "cog.tif"), "w", **meta) as mem:
+                yield mem
+
+
+def _downsample(data, resampling, nodata=None):
+    """
+    Halve the last two dimensions of an array (odd sizes rounded up), as GDAL builds a 2x overview.
+
+    Nodata pixels, and the missing pixels of the last row and column of odd
+    sized arrays, are left out of the average and mode.
+    """
+    if resampling == "nearest":
+        # The top left pixel of each 2x2 window
+        return data[..., ::2, ::2]
+
+    height, width = data.shape[-2:]
+    out_height, out_width = (height + 1) // 2, (width + 1) // 2
+    if nodata is None:
+        valid = numpy.ones(data.shape, dtype=bool)
+    elif numpy.isnan(nodata):
+        valid = ~numpy.isnan(data)
+    else:
+        valid = data != nodata
+    pad = [(0, 0)] * (data.ndim - 2) + [(0, out_height * 2 - height), (0, out_width * 2 - width)]
+    data = numpy.pad(data, pad, mode="edge")
+    valid = numpy.pad(valid, pad, mode="constant", constant_values=False)
+
+    # The 4 pixels of each 2x2 window along a new first axis
+    shape = data.shape[:-2] + (out_height, 2, out_width, 2)
+    order = (data.ndim - 1, data.ndim + 1) + tuple(range(data.ndim - 2)) + (data.ndim - 2, data.ndim)
+    quads = data.reshape(shape).transpose(order).reshape((4,) + shape[:-4] + (out_height, out_width))
+    valid = valid.reshape(shape).transpose(order).reshape(quads.shape)
+    count = valid.sum(axis=0)
+    fill = nodata if nodata is not None else 0
+
+    if resampling == "average":
+        total = numpy.where(valid, quads, 0).sum(axis=0, dtype="float64")
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+        if numpy.issubdtype(data.dtype, numpy.integer):
+            mean = numpy.floor(mean + 0.5)
+        return numpy.where(count > 0, mean, fill).astype(data.dtype)
+
+    # Mode: the most frequent valid value, and on ties the first one to reach that count
+    # scanning the window (as GDAL counts them)
+    running = numpy.stack([((quads[:k + 1] == quads[k]) & valid[:k + 1]).sum(axis=0) for k in range(4)])
+    running[~valid] = 0
+    first = (running == running.max(axis=0)).argmax(axis=0)
+    best = numpy.take_along_axis(quads, first[None], axis=0)[0]
+    return numpy.where(count > 0, best, fill).astype(data.dtype)
+
+
+class _Pyramid(object):
+    """Overview levels of a raster, built from each block as it is written."""
+
+    def __init__(self, meta, resampling, overview_level):
+        self.resampling = resampling
+        self.nodata = meta.get("nodata")
+        fill = self.nodata if self.nodata is not None else 0
+        self.levels = []
+        for j in range(1, overview_level + 1):
+            factor = 2 ** j
+            shape = (meta["count"], -(-meta["height"] // factor), -(-meta["width"] // factor))
+            self.levels.append(numpy.full(shape, fill, dtype=meta["dtype"]))
+
+    def add(self, matrix, window):
+        # Block offsets are multiples of 2 ** overview_level, so each block has its own overview pixels
+        row, col = int(window.row_off), int(window.col_off)
+        for level in self.levels:
+            matrix = _downsample(matrix, self.resampling, self.nodata)
+            row, col = row // 2, col // 2
+            level[:, row:row + matrix.shape[-2], col:col + matrix.shape[-1]] = matrix
+
+
+def _overview_vrt(path, overview_paths):
+    """XML of a VRT of the raster at path, with the rasters at overview_paths as its overviews."""
+    with MemoryFile(ext=".vrt") as memfile:
+        copy(path, memfile.name, driver="VRT")
+        root = ElementTree.fromstring(memfile.read())
+
+    for source in root.iter("SourceFilename"):
+        source.set("relativeToVRT", "0")
+        source.text = path
+    for band in root.iter("VRTRasterBand"):
+        for overview_path in overview_paths:
+            overview = ElementTree.SubElement(band, "Overview")
+            ElementTree.SubElement(overview, "SourceFilename", relativeToVRT="0").text = overview_path
+            ElementTree.SubElement(overview, "SourceBand").text = band.get("band")
+    return ElementTree.tostring(root)
+
+
+class _SourceReader(object):
+    """
+    Reads windows of a set of bands of an open source, through a buffer of whole chunk rows.
+
+    Windows are read in row-major order. Output blocks rarely line up with the chunks of NetCDF sources, so
+    reading them one by one would decompress the chunks they straddle several times: instead, the source is read
+    in full-width strips ending on a chunk boundary, and the rows past the current block row are kept for the next.
+    The last window read is kept, for the outputs sharing the reader.
+
+    Strips are only buffered if they fit in 'buffer_limit' bytes; otherwise each window is read on its own.
+    """
+
+    def __init__(self, src, indexes, block_height=None, buffer_limit=STRIP_BUFFER_LIMIT, block_width=None):
+        self.src = src
+        self.indexes = list(indexes)
+
+        chunk_height = src.block_shapes[0][0]
+        block_height = block_height or chunk_height
+        itemsize = numpy.dtype(src.dtypes[0]).itemsize
+        strip_nbytes = len(self.indexes) * src.width * (block_height + chunk_height) * itemsize
+        self.chunk_height = chunk_height if strip_nbytes <= buffer_limit else None
+        # Largest number of bytes of source pixels held at once: a strip, or the last window read of all the bands
+        window_nbytes = len(self.indexes) * min(block_width or src.width, src.width) * block_height * itemsize
+        self.nbytes = strip_nbytes if self.chunk_height is not None else window_nbytes
+        self.rows = None
+        self.rows_start = 0
+        self.window = None
+        self.matrix = None
+
+    def read(self, w):
+        if w == self.window:
+            return self.matrix
+
+        if self.chunk_height is None:
+            matrix = self.src.read(window=w, indexes=self.indexes)
+        else:
+            row_end = w.row_off + w.height
+            if self.rows is None or row_end > self.rows_start + self.rows.shape[-2]:
+                if self.rows is None or w.row_off < self.rows_start:
+                    kept, read_start = None, w.row_off - w.row_off % self.chunk_height
+                else:
+                    kept = self.rows[:, w.row_off - self.rows_start:]
+                    read_start = self.rows_start + self.rows.shape[-2]
+                read_end = min(-(-row_end // self.chunk_height) * self.chunk_height, self.src.height)
+                strip = self.src.read(window=Window(0, read_start, self.src.width, read_end - read_start),
+                                      indexes=self.indexes)
+                if kept is not None and kept.shape[-2]:
+                    strip = numpy.concatenate([kept, strip], axis=-2)
+                    read_start = w.row_off
+                self.rows, self.rows_start = strip, read_start
+
+            matrix = self.rows[:, w.row_off - self.rows_start:row_end - self.rows_start,
+                               w.col_off:w.col_off + w.width]
+
+        self.window, self.matrix = w, matrix
+        return matrix
+
+    def close(self):
+        self.rows = self.matrix = self.window = None
+
+
+class _BandJob(object):
+    """One output COG staged from a set of bands of an open source."""
+
+    def __init__(self, src, indexes, dst_path, dst_kwargs, overview_resampling, buffer_limit=STRIP_BUFFER_LIMIT):
+        self.src = src
+        self.indexes = indexes
+        self.dst_path = dst_path
+        self.dst_kwargs = dst_kwargs
+        self.overview_resampling = overview_resampling
+        self.nodata_mask = None
+
+        meta = src.meta
+        meta["count"] = len(indexes)
+        meta.pop("alpha", None)
+
+        meta.update(**dst_kwargs)
+        meta.pop("compress", None)
+        meta.pop("photometric", None)
+
+        # Byte bands with a negative nodata can't hold it, so they are promoted to int16
+        self.nodata = src.nodatavals[0]
+        if src.dtypes[0] == 'uint8' and self.nodata is not None and self.nodata < 0:
+            self.nodata_mask = 255
+            meta['nodata'] = self.nodata
+            meta['dtype'] = 'int16'
+        meta['stats'] = True
+        self.meta = meta
+        self.mem = None
+        self.pyramid = None
+
+        # Reads the pixels of this output, possibly shared with the outputs of other bands of the source
+        self.reader = _SourceReader(src, indexes, meta.get("blockysize"), buffer_limit, meta.get("blockxsize"))
+        self.positions = None
+
+    def stream_overviews(self, overview_level):
+        """Build the overviews while writing the blocks, if the resampling and block size allow it."""
+        factor = 2 ** overview_level
+        if (self.overview_resampling in STREAMING_RESAMPLING and self.meta.get("tiled")
+                and self.meta.get("blockxsize", 1) % factor == 0 and self.meta.get("blockysize", 1) % factor == 0):
+            self.pyramid = _Pyramid(self.meta, self.overview_resampling, overview_level)
+
+    @property
+    def grid(self):
+        return self.meta["width"], self.meta["height"], self.meta.get("blockxsize"), self.meta.get("blockysize")
+
+    def write_window(self, w):
+        matrix = self.reader.read(w)
+        if self.positions is not None:
+            matrix = matrix[self.positions]
+        if self.nodata_mask is not None:
+            matrix = numpy.array(matrix, dtype='int16')
+            matrix[matrix==self.nodata_mask] = self.nodata
+
+        self.mem.write(matrix, window=w)
+        if self.pyramid is not None:
+            self.pyramid.add(matrix, w)
+
+    @contextmanager
+    def _staged_pyramid(self, in_memory, temp_dir):
+        """Stage the streamed overview levels, and yield a VRT of the raster exposing them as its overviews."""
+        self.mem.update_tags(
+            OVR_RESAMPLING_ALG=Resampling[self.overview_resampling].name.upper()
+        )
+        # Closing the raster flushes it, so that the VRT reads all its blocks
+        self.mem.close()
+        with ExitStack() as stack:
+            overview_paths = []
+            for level in self.pyramid.levels:
+                # Only the pixels of an overview are read through the VRT, not its georeferencing
+                meta = dict(self.meta, height=level.shape[-2], width=level.shape[-1])
+                overview = stack.enter_context(_temporary_dataset(meta, in_memory, temp_dir))
+                overview.write(level)
+                overview.close()
+                overview_paths.append(overview.name)
+            self.pyramid = None
+
+            vrt = stack.enter_context(MemoryFile(_overview_vrt(self.mem.name, overview_paths), ext=".vrt"))
+            yield vrt.name
+
+    def finalise(self, overview_level, in_memory=True, temp_dir=None, upload=None):
+        band = os.path.basename(str(self.dst_path))
+        with ExitStack() as stack:
+            if self.pyramid is not None:
+                with stage("stage_overviews", band=band):
+                    src = stack.enter_context(self._staged_pyramid(in_memory, temp_dir))
+            else:
+                self._build_overviews(overview_level, band)
+                src = self.mem
+
+            if upload is not None and in_memory:
+                # The COG is only written to memory, and handed over as a file object
+                memfile = stack.enter_context(MemoryFile(ext=".tif"))
+                with stage("copy", band=band) as record:
+                    copy(src, memfile.name, copy_src_overviews=True, **self.dst_kwargs)
+                    record["output_size"] = memfile.getbuffer().nbytes
+                with stage("upload", band=band):
+                    upload(memfile, self.dst_path)
+                return
+
+            if upload is not None:
+                # Rasters staged in scratch files are too large for memory, and so is their COG
+                tmpdir = stack.enter_context(tempfile.TemporaryDirectory(dir=temp_dir))
+                tmp_path = os.path.join(tmpdir, band)
+                with stage("copy", band=band) as record:
+                    copy(src, tmp_path, copy_src_overviews=True, **self.dst_kwargs)
+                    record["output_size"] = os.path.getsize(tmp_path)
+                with stage("upload", band=band):
+                    with open(tmp_path, "rb") as fileobj:
+                        upload(fileobj, self.dst_path)
+                return
+
+            # Write then rename, so that a half-written COG never sits at dst_path
+            with stage("copy", band=band) as record:
+                with replacing(str(self.dst_path)) as tmp_path:
+                    copy(src, tmp_path, copy_src_overviews=True, **self.dst_kwargs)
+                record["output_size"] = os.path.getsize(self.dst_path)
+
+    def _build_overviews(self, overview_level, band):
+        if self.overview_resampling is not None:
+            with stage("build_overviews", band=band):
+                overviews = [2 ** j for j in range(1, overview_level + 1)]
+
+                self.mem.build_overviews(overviews, Resampling[self.overview_resampling])
+                self.mem.update_tags(
+                    OVR_RESAMPLING_ALG=Resampling[self.overview_resampling].name.upper()
+                )
+
+
+def _finalise_in_env(job, config, *args):
+    """Finalise an output in a worker thread, which does not inherit the GDAL options of the caller's Env."""
+    with rasterio.Env(**config):
+        job.finalise(*args)
+
+
+def cog_translate_many(
+    bands,
+    overview_level=5,
+    config=None,
+    in_memory=None,
+    temp_dir=None,
+    max_workers=1,
+    streaming_overviews=False,
+    upload=None,
+    stack_reads=True,
+    buffer_limit=STRIP_BUFFER_LIMIT,
+):
+    """
+    Create several Cloud Optimized Geotiffs in a single sweep over their sources.
+
+    Each source is opened once, and every block window is read for all the
+    outputs sharing its grid before moving on to the next one. Overviews and
+    compression are then done per output, optionally in threads.
+
+    Parameters
+    ----------
+    bands : list of dict
+        One entry per output COG, with keys
+        ``src`` (dataset path or an open rasterio dataset),
+        ``dst_path``, ``dst_kwargs`` (output dataset creation options),
+        and optionally ``indexes`` and ``overview_resampling``.
+    overview_level : int, optional (default: 5)
+        COGEO overview (decimation) level
+    config : dict
+        Rasterio Env options.
+    in_memory : bool, optional
+        Stage the rasters in memory (True) or in scratch files (False).
+        By default it is chosen from their total size (see IN_MEMORY_THRESHOLD).
+    temp_dir : str, optional
+        Scratch directory, e.g. $PBS_JOBFS (default: system temporary directory).
+    max_workers : int, optional (default: 1)
+        Number of outputs to build overviews for and compress concurrently.
+    streaming_overviews : bool, optional (default: False)
+        Build the overviews from each block as it is written, instead of
+        reading the staged rasters back (only for the average, nearest and
+        mode resampling, with block sizes divisible by 2 ** overview_level).
+        The overviews are kept in memory until the outputs are written.
+    upload : callable, optional
+        Called as upload(fileobj, dst_path) with each finished COG, to store
+        it elsewhere (e.g. object storage) instead of writing it to dst_path.
+        The COG is written to memory, or to temp_dir if the rasters are not
+        staged in memory.
+    stack_reads : bool, optional (default: True)
+        Read each window once for all the outputs taking bands of the same
+        source (e.g. the time slices of a NetCDF variable), instead of once
+        per output, so that chunks spanning several bands are decoded once.
+    buffer_limit : int, optional (default: STRIP_BUFFER_LIMIT)
+        Bytes of source rows buffered at once, shared by the readers of all
+        the outputs, and counted with the rasters when choosing in_memory.
+
+    """
+    config = config or {}
+
+    with rasterio.Env(**config):
+        with ExitStack() as stack:
+            sources = {}
+            jobs = []
+            # Each output has an equal share of the buffer, pooled by the outputs sharing a reader
+            share = buffer_limit // max(1, len(bands))
+            for band in bands:
+                src = band["src"]
+                if isinstance(src, (str, os.PathLike)):
+                    if src not in sources:
+                        sources[src] = stack.enter_context(rasterio.open(src))
+                    src = sources[src]
+                indexes = band.get("indexes") or src.indexes
+                jobs.append(_BandJob(src, indexes, band["dst_path"], band["dst_kwargs"],
+                                     band.get("overview_resampling"), share))
+
+            if stack_reads:
+                stacks = {}
+                for job in jobs:
+                    stacks.setdefault((id(job.src), job.grid), []).append(job)
+                for stack_jobs in stacks.values():
+                    if len(stack_jobs) == 1:
+                        continue
+                    indexes = sorted(set(index for job in stack_jobs for index in job.indexes))
+                    reader = _SourceReader(stack_jobs[0].src, indexes, stack_jobs[0].meta.get("blockysize"),
+                                           share * len(stack_jobs), stack_jobs[0].meta.get("blockxsize"))
+                    if reader.chunk_height is None and stack_jobs[0].reader.chunk_height is not None:
+                        # Too many bands to buffer strips of them all: strips are worth more
+                        continue
+                    for job in stack_jobs:
+                        job.reader = reader
+                        job.positions = [indexes.index(index) for index in job.indexes]
+
+            if in_memory is None:
+                # The windows read for all the time slices of a stack at once are counted with the strips
+                readers = {id(job.reader): job.reader for job in jobs}
+                in_memory = (sum(_raster_nbytes(job.meta, overview_level) for job in jobs) +
+                             sum(reader.nbytes for reader in readers.values())) < IN_MEMORY_THRESHOLD
+
+            grids = {}
+            for job in jobs:
+                job.mem = stack.enter_context(_temporary_dataset(job.meta, in_memory, temp_dir))
+                if streaming_overviews:
+                    job.stream_overviews(overview_level)
+                grids.setdefault(job.grid, []).append(job)
+
+            with stage("read_write_blocks", bands=len(jobs), in_memory=in_memory):
+                for grid_jobs in grids.values():
+                    for ij, w in grid_jobs[0].mem.block_windows(1):
+                        for job in grid_jobs:
+                            job.write_window(w)
+                for job in jobs:
+                    job.reader.close()
+
+            if max_workers > 1 and len(jobs) > 1:
+                # Each output is written to its own file, so finishing them side by
+                # side gives the same bytes as doing it one after the other
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(_finalise_in_env, job, config, overview_level, in_memory, temp_dir,
+                                               upload)
+                               for job in jobs]
+                    for future in futures:
+                        future.result()
+            else:
+                for job in jobs:
+                    job.finalise(overview_level, in_memory, temp_dir, upload)
 
 
 def cog_translate(
@@ -22,6 +523,9 @@ def cog_translate(
     overview_level=5,
     overview_resampling=None,
     config=None,
+    in_memory=None,
+    temp_dir=None,
+    streaming_overviews=False,
 ):
     """
     Create Cloud Optimized Geotiff.
@@ -41,51 +545,24 @@ def cog_translate(
         COGEO overview (decimation) level
     config : dict
         Rasterio Env options.
+    in_memory : bool, optional
+        Stage the raster in memory (True) or in a scratch file (False).
+        By default it is chosen from the raster size (see IN_MEMORY_THRESHOLD).
+    temp_dir : str, optional
+        Scratch directory, e.g. $PBS_JOBFS (default: system temporary directory).
+    streaming_overviews : bool, optional (default: False)
+        Build the overviews while the blocks are written (see cog_translate_many).
 
     """
-    config = config or {}
-
-    nodata_mask = None
-    src = gdal.Open(src_path, gdal.GA_ReadOnly)
-    band = src.GetRasterBand(1)
-    nodata = band.GetNoDataValue() 
-    if band.DataType == gdal.GDT_Byte and  band.GetNoDataValue() < 0:
-            nodata_mask = 255
-    src = None
-
-    with rasterio.Env(**config):
-        with rasterio.open(src_path) as src:
-
-            indexes = indexes if indexes else src.indexes
-            meta = src.meta
-            meta["count"] = len(indexes)
-            meta.pop("alpha", None)
-
-            meta.update(**dst_kwargs)
-            meta.pop("compress", None)
-            meta.pop("photometric", None)
-            if nodata_mask is not None:
-                meta['nodata'] = nodata
-                meta['dtype'] = 'int16'
-            meta['stats'] = True
-
-            with MemoryFile() as memfile:
-                with memfile.open(**meta) as mem:
-                    wind = list(mem.block_windows(1))
-                    for ij, w in wind:
-                        matrix = src.read(window=w, indexes=indexes)
-                        if nodata_mask is not None:
-                            matrix = numpy.array(matrix, dtype='int16')
-                            matrix[matrix==nodata_mask] = nodata
-
-                        mem.write(matrix, window=w)
-                        
-                    if overview_resampling is not None:
-                        overviews = [2 ** j for j in range(1, overview_level + 1)]
-
-                        mem.build_overviews(overviews, Resampling[overview_resampling])
-                        mem.update_tags(
-                            OVR_RESAMPLING_ALG=Resampling[overview_resampling].name.upper()
-                        )
-
-                    copy(mem, dst_path, copy_src_overviews=True, **dst_kwargs)
+    cog_translate_many(
+        [{"src": src_path,
+          "indexes": indexes,
+          "dst_path": dst_path,
+          "dst_kwargs": dst_kwargs,
+          "overview_resampling": overview_resampling}],
+        overview_level=overview_level,
+        config=config,
+        in_memory=in_memory,
+        temp_dir=temp_dir,
+        streaming_overviews=streaming_overviews,
+    )
@@ -0,0 +1,58 @@
+"""
+Safe writes of the files shared between processes.
+
+Records appended to a shared JSON Lines file (completion ledgers, stage
+metrics) are written with a single O_APPEND write, which keeps the records of
+concurrent processes whole. Files replaced as a whole (COGs, YAMLs, metrics
+snapshots, watermarks) are written under a temporary name unique to the
+process, then renamed, so that readers never see a half-written file and two
+processes writing the same output do not write into each other's file.
+"""
+import json
+import os
+import socket
+from contextlib import contextmanager
+
+
+def append_record(path, record):
+    """
+    Append a JSON record as one line of 'path'
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + '\n').encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def temporary_name(path):
+    """
+    Name 'path' is written under before being renamed, unique to this process
+    """
+    return '{}.{}.{}.part'.format(path, socket.gethostname(), os.getpid())
+
+
+@contextmanager
+def replacing(path):
+    """
+    Yield a temporary name to write 'path' under, renamed to 'path' once the block completes
+    """
+    tmp_path = temporary_name(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_replacing(path, data):
+    """
+    Write 'data' (str or bytes) to 'path' through a temporary file, and return its size in bytes
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    with replacing(str(path)) as tmp_path:
+        with open(tmp_path, 'wb') as fp:
+            fp.write(data)
+    return len(data)
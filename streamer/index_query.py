@@ -0,0 +1,114 @@
+"""
+Projected, paginated queries of the datasets of a product in an ODC index.
+
+`Index.datasets.search_returning` fetches the whole metadata document of each
+dataset when a field such as the tile coordinates is asked for, and hands the
+results over once the whole query is done. The query here runs on the agdc
+schema directly: it selects only the location and the few metadata values
+needed to name the outputs, sorted by location, and pages through them with a
+server-side cursor so that memory stays bounded whatever the product size.
+
+The engine is built from the datacube configuration of the environment rather
+than taken from the index, whose internals change between datacube releases.
+"""
+from datacube.config import LocalConfig
+from sqlalchemy import create_engine, text
+
+# Rows fetched from the server-side cursor at a time
+PAGE_SIZE = 10000
+
+# Columns selected for each field used by naming templates
+FIELD_COLUMNS = {
+    'x': ["(d.metadata #>> '{grid_spatial,projection,geo_ref_points,ll,x}')::double precision AS ll_x"],
+    'y': ["(d.metadata #>> '{grid_spatial,projection,geo_ref_points,ll,y}')::double precision AS ll_y"],
+    'time': ["agdc.common_timestamp(d.metadata #>> '{extent,from_dt}') AS from_dt",
+             "agdc.common_timestamp(d.metadata #>> '{extent,to_dt}') AS to_dt"],
+    'lat': ["least({0}) AS lat_begin, greatest({0}) AS lat_end".format(
+        ', '.join(f"(d.metadata #>> '{{extent,coord,{corner},lat}}')::double precision"
+                  for corner in ('ll', 'lr', 'ul', 'ur')))],
+    'lon': ["least({0}) AS lon_begin, greatest({0}) AS lon_end".format(
+        ', '.join(f"(d.metadata #>> '{{extent,coord,{corner},lon}}')::double precision"
+                  for corner in ('ll', 'lr', 'ul', 'ur')))],
+}
+
+# The time expression of the time index ODC creates for each product
+TIME_RANGE = ("tstzrange(agdc.common_timestamp(d.metadata #>> '{extent,from_dt}'), "
+              "agdc.common_timestamp(d.metadata #>> '{extent,to_dt}'), '[]')")
+
+
+# When a dataset, or its location, was last added to the index
+ADDED = "greatest(d.added, dl.added)"
+
+
+# Index drivers storing the index in the agdc postgres schema
+POSTGRES_DRIVERS = ('default', 'postgres')
+
+
+def index_engine(datacube_env=None, application_name='cog-conversion'):
+    """
+    SQLAlchemy engine on the postgres database holding the index of a datacube environment
+    """
+    config = LocalConfig.find(env=datacube_env)
+    driver = config.get('index_driver', 'default')
+    if driver not in POSTGRES_DRIVERS:
+        raise ValueError(f"The index of datacube environment {datacube_env or 'default'!r} uses the "
+                         f"{driver!r} driver, but only the postgres index can be queried directly")
+
+    connect_args = {'dbname': config['db_database'], 'application_name': application_name}
+    for key, option in (('host', 'db_hostname'), ('port', 'db_port'), ('user', 'db_username'),
+                        ('password', 'db_password')):
+        value = config.get(option)
+        if value:
+            connect_args[key] = value
+    return create_engine('postgresql://', connect_args=connect_args)
+
+
+def dataset_query(fields, time_range=None, since=False):
+    """
+    SQL query of the locations and 'fields' of the active datasets of a product, ordered by location
+
+    The query takes the parameters 'product', 'start' and 'end' if 'time_range' is set, and 'since' if 'since' is
+    set, in which case it also selects the time the dataset or its location was added to the index.
+    """
+    columns = ["dl.uri_scheme || ':' || dl.uri_body AS uri"]
+    for field in FIELD_COLUMNS:
+        if field in fields:
+            columns.extend(FIELD_COLUMNS[field])
+    if since:
+        columns.append(f"{ADDED} AS added")
+
+    where = ["dt.name = :product", "d.archived IS NULL", "dl.archived IS NULL"]
+    if time_range is not None:
+        where.append(f"{TIME_RANGE} && tstzrange(:start, :end, '[)')")
+    if since:
+        where.append(f"{ADDED} > :since")
+
+    return text(f"SELECT {', '.join(columns)} "
+                f"FROM agdc.dataset d "
+                f"JOIN agdc.dataset_type dt ON dt.id = d.dataset_type_ref "
+                f"JOIN agdc.dataset_location dl ON dl.dataset_ref = d.id "
+                f"WHERE {' AND '.join(where)} "
+                f"ORDER BY uri COLLATE \"C\"")
+
+
+def search_datasets(engine, product, fields, time_range=None, since=None, page_size=PAGE_SIZE):
+    """
+    Yield the rows of the active datasets of a product, with the given fields, ordered by location
+
+    'time_range' is a (start, end) pair of datetimes, or None for the whole product. If 'since' is set, only the
+    datasets added or relocated after it are returned, with their 'added' time.
+    """
+    params = {'product': product}
+    if time_range is not None:
+        params['start'], params['end'] = time_range
+    if since is not None:
+        params['since'] = since
+
+    with engine.connect() as connection:
+        query = dataset_query(fields, time_range, since is not None)
+        result = connection.execution_options(stream_results=True).execute(query, params)
+        while True:
+            rows = result.fetchmany(page_size)
+            if not rows:
+                break
+            yield from rows
@@ -0,0 +1,142 @@
+"""
+Local cache of the S3 inventory of the public data bucket.
+
+The CSV inventory of the bucket is published daily as a new manifest. Instead
+of streaming the whole inventory for each work list, the keys are loaded once
+per manifest date into an SQLite database, where they are the primary key:
+checking which outputs of a product are missing is then a set of index
+lookups.
+
+A refresh loads the data files of the latest manifest one at a time and
+records each one as it is committed, so an interrupted refresh resumes where
+it stopped. Keys missing from the new manifest are dropped at the end.
+"""
+import csv
+import gzip
+import io
+import json
+import sqlite3
+from pathlib import Path
+
+DEFAULT_CACHE = Path.home() / '.cache' / 'cog-conversion' / 'inventory.sqlite'
+
+# Number of keys looked up per query
+LOOKUP_BATCH = 512
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    url TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS data_file (
+    manifest TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (manifest, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS object (
+    key TEXT PRIMARY KEY,
+    date TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def manifest_date(manifest_url):
+    """
+    Date of a manifest from its folder name, e.g. '2019-05-20T08-00Z'
+    """
+    return manifest_url.rstrip('/').split('/')[-2]
+
+
+class InventoryCache:
+    """
+    Keys of an S3 inventory, indexed in an SQLite database
+
+    Only the keys ending with one of 'suffixes' are kept.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE, suffixes=('.yaml',)):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.suffixes = tuple(suffixes)
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(SCHEMA)
+
+    @property
+    def date(self):
+        """
+        Date of the latest manifest completely loaded, or None
+        """
+        row = self.db.execute('SELECT max(date) FROM manifest WHERE complete').fetchone()
+        return row[0]
+
+    def refresh(self, inventory_manifest, s3):
+        """
+        Load the latest manifest under the 'inventory_manifest' folder, unless it is already loaded
+
+        Returns the date of the manifest.
+        """
+        from dea.aws import s3_fetch
+        from dea.aws.inventory import find_latest_manifest
+
+        manifest_url = inventory_manifest
+        if manifest_url.endswith('/'):
+            manifest_url = find_latest_manifest(manifest_url, s3)
+        date = manifest_date(manifest_url)
+
+        with self.db:
+            self.db.execute('INSERT OR IGNORE INTO manifest (url, date) VALUES (?, ?)', (manifest_url, date))
+        if self.db.execute('SELECT complete FROM manifest WHERE url = ?', (manifest_url,)).fetchone()[0]:
+            return date
+
+        info = json.loads(s3_fetch(manifest_url, s3=s3))
+        schema = [field.strip() for field in info['fileSchema'].split(',')]
+        key_field = schema.index('Key')
+        bucket = info['destinationBucket'].split(':')[-1]
+        loaded = {row[0] for row in self.db.execute('SELECT key FROM data_file WHERE manifest = ?',
+                                                    (manifest_url,))}
+
+        for data_file in info['files']:
+            if data_file['key'] in loaded:
+                continue
+            data = s3_fetch(f's3://{bucket}/{data_file["key"]}', s3=s3)
+            with gzip.open(io.BytesIO(data), 'rt') as fd:
+                keys = ((row[key_field], date)
+                        for row in csv.reader(fd)
+                        if row[key_field].endswith(self.suffixes))
+                with self.db:
+                    self.db.executemany('INSERT OR REPLACE INTO object (key, date) VALUES (?, ?)', keys)
+                    self.db.execute('INSERT INTO data_file (manifest, key) VALUES (?, ?)',
+                                    (manifest_url, data_file['key']))
+
+        with self.db:
+            self.db.execute('DELETE FROM object WHERE date < ?', (date,))
+            self.db.execute('UPDATE manifest SET complete = 1 WHERE url = ?', (manifest_url,))
+            self.db.execute('DELETE FROM data_file WHERE manifest != ?', (manifest_url,))
+            self.db.execute('DELETE FROM manifest WHERE url != ?', (manifest_url,))
+        return date
+
+    def missing(self, items, suffix='.yaml'):
+        """
+        Yield the items of an iterable of (item, prefix) pairs whose 'prefix + suffix' key is not in the inventory
+        """
+        batch = []
+        for item, prefix in items:
+            batch.append((item, prefix + suffix))
+            if len(batch) == LOOKUP_BATCH:
+                yield from self._missing(batch)
+                batch = []
+        yield from self._missing(batch)
+
+    def _missing(self, batch):
+        if not batch:
+            return
+        placeholders = ','.join('?' * len(batch))
+        found = {row[0] for row in self.db.execute(f'SELECT key FROM object WHERE key IN ({placeholders})',
+                                                   [key for _, key in batch])}
+        for item, key in batch:
+            if key not in found:
+                yield item
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,110 @@
+"""
+Completion ledger of the COGs written to an output directory.
+
+Each output directory holds an append-only JSON Lines file with one record per
+completed COG: the source NetCDF path, size and mtime, and the output size and
+MD5 checksum. Deciding whether an output can be skipped then only takes a
+ledger lookup and two stat calls, instead of decoding the output pixels.
+
+Checksums of local outputs take a read of the whole output, so they are only
+computed on request; uploads come with theirs. The ledger of each directory is
+parsed once per process, and kept up to date with the records it appends.
+"""
+import hashlib
+import json
+import os
+from os.path import join as pjoin, basename, dirname
+
+from fileio import append_record
+
+LEDGER_NAME = '.cog_ledger.jsonl'
+
+# Ledgers opened by this process, by directory
+_LEDGERS = {}
+
+
+def _md5sum(fname, chunk_size=1024 ** 2):
+    digest = hashlib.md5()
+    with open(fname, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompletionLedger:
+    """
+    Append-only record of the COGs completed in one output directory
+    """
+
+    def __init__(self, out_dir, checksums=False):
+        self.path = pjoin(out_dir, LEDGER_NAME)
+        self.checksums = checksums
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path) as fd:
+                    for line in fd:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A record cut short by a killed job
+                            continue
+                        self._entries[entry['output']] = entry
+            except FileNotFoundError:
+                pass
+        return self._entries
+
+    def is_complete(self, out_fname, src_fname, size_of=os.path.getsize):
+        """
+        True if 'out_fname' was recorded from the current version of 'src_fname' and is still in place
+
+        'size_of' gives the size of the stored output (None if it is missing), by default from the file system.
+        """
+        entry = self.entries.get(basename(out_fname))
+        if entry is None:
+            return False
+        try:
+            src_stat = os.stat(src_fname)
+            out_size = size_of(out_fname)
+        except OSError:
+            return False
+        return (entry['source'] == os.path.abspath(src_fname) and
+                entry['source_size'] == src_stat.st_size and
+                entry['source_mtime'] == src_stat.st_mtime and
+                entry['output_size'] == out_size)
+
+    def record(self, out_fname, src_fname, output_size=None, output_md5=None):
+        """
+        Append the record of a completed output
+
+        The size and checksum of outputs not stored at 'out_fname' (e.g. uploaded) are given by the caller.
+        Otherwise the checksum is only computed with 'checksums', and left out of the record.
+        """
+        src_stat = os.stat(src_fname)
+        entry = {'output': basename(out_fname),
+                 'source': os.path.abspath(src_fname),
+                 'source_size': src_stat.st_size,
+                 'source_mtime': src_stat.st_mtime,
+                 'output_size': output_size if output_size is not None else os.path.getsize(out_fname),
+                 'output_md5': output_md5}
+        if output_md5 is None and self.checksums:
+            entry['output_md5'] = _md5sum(out_fname)
+
+        append_record(self.path, entry)
+        self.entries[entry['output']] = entry
+
+    @classmethod
+    def for_prefix(cls, prefix, checksums=False):
+        """
+        Ledger of the directory the outputs of 'prefix' are written to, shared by the files converted by this process
+        """
+        out_dir = dirname(prefix) or '.'
+        ledger = _LEDGERS.get(out_dir)
+        if ledger is None:
+            ledger = _LEDGERS[out_dir] = cls(out_dir)
+        ledger.checksums = checksums
+        return ledger
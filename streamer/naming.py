@@ -0,0 +1,163 @@
+"""
+Compiled file naming templates.
+
+Templates are `str.format` strings such as
+'x_{x}/y_{y}/LS_WATER_3577_{x}_{y}_{time:%Y-%m-%d}'. They are parsed once per
+template (see `compile_template`) rather than once per file, and the output
+directories made from them are only created once per process.
+
+This module only depends on the standard library, so that both the converter
+and work_list.py can use it.
+"""
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+from os.path import join as pjoin, basename
+from string import Formatter
+
+# Stem of a file name, and the numbers following an underscore in it
+_STEM = re.compile(r"[-\w\d.]*(?=\.\w)")
+_NUMBERS = re.compile(r"(?<=_)[-\d.]+")
+
+# Year, month, day and time of day of a date_time number, as filled in dest_template
+_DATE_PARTS = (re.compile(r"\d{4}"),
+               re.compile(r"(?<=\d{4})\d{2}"),
+               re.compile(r"(?<=\d{6})\d{2}"),
+               re.compile(r"(?<=\d{8})\d+"))
+
+# strptime format of a date_time number, by number of digits
+_TIME_FORMATS = {4: '%Y', 6: '%Y%m', 8: '%Y%m%d', 10: '%Y%m%d%H', 12: '%Y%m%d%H%M', 14: '%Y%m%d%H%M%S'}
+
+_CREATED_DIRS = set()
+
+
+def makedirs(path):
+    """
+    os.makedirs(path, exist_ok=True), done once per directory by each process
+    """
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
+
+
+def _parse_time(token):
+    digits = token.replace('-', '')
+    try:
+        return datetime.strptime(digits, _TIME_FORMATS[len(digits)])
+    except (KeyError, ValueError):
+        raise ValueError('{!r} is not a date'.format(token)) from None
+
+
+def _typed(token, spec):
+    """
+    Value of a number taken from a file name, as needed by the format spec of its field
+    """
+    if '%' in spec:
+        return _parse_time(token)
+    for kind in (int, float):
+        try:
+            return kind(token)
+        except ValueError:
+            pass
+    return token
+
+
+class NameTemplate:
+    """
+    A parsed naming template
+    """
+
+    def __init__(self, template):
+        self.template = template
+        # Distinct field names, in order of appearance
+        self.fields = []
+        # Fields given a format spec somewhere in the template, e.g. {time:%Y%m%d}
+        self.spec_fields = {}
+        for _, name, spec, _ in Formatter().parse(template):
+            if not name:
+                continue
+            if name not in self.fields:
+                self.fields.append(name)
+            if spec:
+                self.spec_fields.setdefault(name, spec)
+        self.plain_fields = [name for name in self.fields if name not in self.spec_fields]
+
+    def format(self, values):
+        """
+        Fill in the template from a mapping of field values (extra values are ignored)
+        """
+        return self.template.format_map(values)
+
+    def head(self, depth):
+        """
+        Template of the first 'depth' path components of this one
+        """
+        return compile_template('/'.join(self.template.split('/')[0:depth]))
+
+
+@lru_cache(maxsize=None)
+def compile_template(template):
+    """
+    The NameTemplate of 'template', parsed on first use only
+    """
+    return NameTemplate(template)
+
+
+class OutputNaming:
+    """
+    Output prefixes of the NetCDF files of a product, from its src_template and dest_template
+
+    The numbers following an underscore in a file name are matched to the
+    last fields of src_template. The first three of them are the x and y
+    indices and a date_time number.
+
+    Fields of dest_template without a format spec are filled in by position,
+    with x, y, then the year, month, day and time of day of date_time (so
+    'x_{x}/y_{y}/{year}/{month}' and 'x_{a}/y_{b}/{c}' name the same
+    directories). Fields with a format spec are filled in by name from the
+    src_template field of that name, as a date for a strftime spec and as a
+    number otherwise, e.g. 'x_{x}/y_{y}/{time:%Y-%m}'. Without a date_time,
+    only the first two directories of dest_template are used.
+    """
+
+    def __init__(self, src_template, dest_template):
+        self.src = compile_template(src_template)
+        self.dest = compile_template(dest_template)
+        self.dest_undated = self.dest.head(2)
+
+    def values(self, stem):
+        """
+        Values of the dest_template fields from the stem of a file name, and whether it holds a date
+        """
+        numbers = _NUMBERS.findall(stem)
+        if len(numbers) > len(self.src.fields):
+            numbers = numbers[-len(self.src.fields):]
+
+        x_index, y_index, date_time = (numbers + [None] * 3)[:3]
+        slots = [x_index, y_index]
+        if date_time is not None:
+            for pattern in _DATE_PARTS:
+                match = pattern.search(date_time)
+                slots.append(match.group(0) if match is not None else None)
+
+        values = {}
+        for k, (name, value) in enumerate(zip(self.dest.plain_fields, slots)):
+            if value is not None or k < 2:
+                values[name] = value
+        src_values = dict(zip(self.src.fields, numbers))
+        for name, spec in self.dest.spec_fields.items():
+            if src_values.get(name) is not None:
+                values[name] = _typed(src_values[name], spec)
+        return values, date_time is not None
+
+    def prefix(self, input_fname, dest_dir):
+        """
+        Output prefix of 'input_fname' in 'dest_dir', whose directory is created if needed
+        """
+        stem = _STEM.search(basename(input_fname)).group(0)
+        values, dated = self.values(stem)
+        template = self.dest if dated else self.dest_undated
+        out_dir = pjoin(dest_dir, template.format(values))
+        makedirs(out_dir)
+        return pjoin(out_dir, stem)
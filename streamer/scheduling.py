@@ -0,0 +1,79 @@
+"""
+Ordering and packing of conversion tasks from their estimated costs.
+
+Costs are in arbitrary units (bytes, or pixels from the NetCDF headers), as
+long as the cost of a task is about proportional to its run time.
+
+This module only depends on the standard library, so that it can be used,
+and tested, without GDAL.
+"""
+import heapq
+
+
+def lpt_order(costs):
+    """
+    Indexes of the tasks of 'costs', longest processing time first (ties in their original order)
+    """
+    return sorted(range(len(costs)), key=lambda k: costs[k], reverse=True)
+
+
+def predict_makespan(costs, num_workers):
+    """
+    Makespan, in cost units, of handing out tasks of 'costs' in order to the first free worker
+    """
+    loads = [0] * max(1, num_workers)
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def walltime_hours(walltime):
+    """
+    Hours of a PBS walltime, given as H:MM:SS
+    """
+    hours, minutes, seconds = (int(part) for part in walltime.split(':'))
+    return hours + minutes / 60 + seconds / 3600
+
+
+def job_capacity(throughput, ncpus, walltime, fill=1.0):
+    """
+    Cost a PBS job of 'ncpus' converts in a 'fill' fraction of its walltime, at 'throughput' per CPU-hour
+
+    The MPI master rank does not convert files.
+    """
+    return throughput * max(1, ncpus - 1) * walltime_hours(walltime) * fill
+
+
+def _pack(costs, num_chunks):
+    loads = [(0, j) for j in range(num_chunks)]
+    chunks = [[] for _ in range(num_chunks)]
+    for k in lpt_order(costs):
+        load, j = heapq.heappop(loads)
+        chunks[j].append(k)
+        heapq.heappush(loads, (load + costs[k], j))
+    return chunks
+
+
+def pack_chunks(costs, capacity):
+    """
+    Split tasks into the fewest chunks of at most 'capacity' total cost, balancing their costs
+
+    Tasks are placed largest first on the least loaded chunk, and chunks are added until
+    none exceeds 'capacity' (a task costing more than 'capacity' gets a chunk of its own).
+    Returns the task indexes of each chunk, largest first.
+    """
+    if not costs:
+        return [[]]
+    if capacity <= 0:
+        return _pack(costs, 1)
+
+    # Tasks over the capacity cannot share their chunk
+    oversized = sum(1 for cost in costs if cost > capacity)
+    rest = sum(cost for cost in costs if cost <= capacity)
+    num_chunks = int(min(max(1, oversized + -(-rest // capacity)), len(costs)))
+    while True:
+        chunks = _pack(costs, num_chunks)
+        if num_chunks == len(costs) or all(len(chunk) == 1 or sum(costs[k] for k in chunk) <= capacity
+                                           for chunk in chunks):
+            return chunks
+        num_chunks += 1
@@ -0,0 +1,85 @@
+"""
+Output of the COGs and YAMLs to S3-compatible object storage.
+
+Finished outputs are uploaded with multipart uploads, from memory (or from a
+scratch file for rasters too large for it), instead of being written under the
+output directory and synced to the bucket later. The output directory still
+holds the completion ledgers, and its layout gives the object keys: an output
+written to OUTPUT_DIR/x_9/y_-39/... is stored as PREFIX/x_9/y_-39/... in the
+bucket.
+
+boto3 is only needed when an output bucket is configured.
+"""
+import hashlib
+import os
+from functools import lru_cache
+
+# Size of the parts of multipart uploads, and of the smallest object uploaded in parts
+MULTIPART_CHUNKSIZE = 16 * 1024 ** 2
+
+
+@lru_cache(maxsize=None)
+def _client(endpoint_url, max_connections):
+    """
+    S3 client of this process, whose connection pool is shared by all uploads
+    """
+    import boto3
+    from botocore.config import Config
+
+    return boto3.session.Session().client('s3', endpoint_url=endpoint_url,
+                                          config=Config(max_pool_connections=max_connections))
+
+
+class S3Storage:
+    """
+    Outputs stored in an S3 bucket under a key prefix
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, max_concurrency=8, max_connections=None):
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.endpoint_url = endpoint_url
+        self.max_connections = max_connections or max_concurrency
+        self.transfer_config = TransferConfig(multipart_threshold=MULTIPART_CHUNKSIZE,
+                                              multipart_chunksize=MULTIPART_CHUNKSIZE,
+                                              max_concurrency=max_concurrency)
+
+    @property
+    def client(self):
+        return _client(self.endpoint_url, self.max_connections)
+
+    def key(self, path, root):
+        """
+        Object key of an output path under the output directory 'root'
+        """
+        key = os.path.relpath(path, root).replace(os.sep, '/')
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def upload(self, fileobj, key, content_type):
+        """
+        Upload a file object from its start, and return its size and MD5 checksum
+        """
+        digest = hashlib.md5()
+        fileobj.seek(0)
+        for chunk in iter(lambda: fileobj.read(MULTIPART_CHUNKSIZE), b''):
+            digest.update(chunk)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs={'ContentType': content_type},
+                                   Config=self.transfer_config)
+        return size, digest.hexdigest()
+
+    def size(self, key):
+        """
+        Size of an object, or None if it does not exist
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as error:
+            if error.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
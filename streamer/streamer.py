@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 import logging
+import multiprocessing
 import os
 import re
 import sys
+import signal
 import subprocess
+import time
+import io
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
 from os.path import join as pjoin, basename, exists
 from subprocess import check_call
@@ -11,16 +19,26 @@ from pandas import Timestamp
 from pathlib import Path
 import click
 import gdal
+import netCDF4
 import numpy as np
-import xarray
+import rasterio
 import yaml
 from yaml import CSafeLoader as Loader, CSafeDumper as Dumper
 from enum import IntEnum
 
 from datacube import Datacube
 from datacube.model import Range
-from mpi4py import MPI
-from cogeo import cog_translate
+from autotune import autotune, parse_candidate
+from cogeo import STRIP_BUFFER_LIMIT, cog_translate_many, compression_options, merge_codecs
+from fileio import write_replacing
+from index_query import index_engine, search_datasets
+from ledger import CompletionLedger
+from naming import OutputNaming
+from scheduling import job_capacity, lpt_order, pack_chunks, predict_makespan
+import timing
+from storage import S3Storage
+from telemetry import ThroughputMonitor
+from watermark import DEFAULT_DIR as WATERMARK_DIR, Watermark, scope_name
 
 LOG = logging.getLogger('cog-converter')
 stdout_hdlr = logging.StreamHandler(sys.stdout)
@@ -40,10 +58,28 @@ products:
         predictor: 2
         default_rsp: average
 """
-MPI_COMM = MPI.COMM_WORLD      # Get MPI communicator object
-MPI_JOB_SIZE = MPI_COMM.size   # Total number of processes
-MPI_JOB_RANK = MPI_COMM.rank   # Rank of this process
-MPI_JOB_STATUS = MPI.Status()  # Get MPI status object
+# mpi4py initialises MPI on import, so it is only imported by the MPI commands (see _init_mpi)
+MPI = None
+MPI_COMM = None                # Get MPI communicator object
+MPI_JOB_SIZE = 1               # Total number of processes
+MPI_JOB_RANK = 0               # Rank of this process
+MPI_JOB_STATUS = None          # Get MPI status object
+POOL_GDAL_CACHEMAX = 256       # GDAL block cache (MiB) of each process of a local pool
+POOL_TASK_TIMEOUT = None       # Time limit of a task in a process of a local pool
+TIMEOUT_GRACE = 60             # Seconds allowed on top of the task timeouts before a worker is considered hung
+AWS_PRODUCTS_CONFIG = pjoin(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'aws_products_config.yaml')
+
+
+def _init_mpi():
+    """
+    Import mpi4py and set up the MPI globals
+    """
+    global MPI, MPI_COMM, MPI_JOB_SIZE, MPI_JOB_RANK, MPI_JOB_STATUS
+    from mpi4py import MPI
+    MPI_COMM = MPI.COMM_WORLD
+    MPI_JOB_SIZE = MPI_COMM.size
+    MPI_JOB_RANK = MPI_COMM.rank
+    MPI_JOB_STATUS = MPI.Status()
 
 
 class TagStatus(IntEnum):
@@ -54,6 +90,13 @@ class TagStatus(IntEnum):
     START = 2
     DONE = 3
     EXIT = 4
+    FAILED = 5
+
+
+class TaskTimeoutError(Exception):
+    """
+    Raised in a task running past its time limit
+    """
 
 
 def run_command(command):
@@ -72,7 +115,11 @@ class COGNetCDF:
     """
 
     def __init__(self, black_list=None, white_list=None, nonpym_list=None, default_rsp=None,
-                 bands_rsp=None, dest_template=None, src_template=None, predictor=None):
+                 bands_rsp=None, dest_template=None, src_template=None, predictor=None,
+                 band_workers=None, band_memory_limit=None, scratch_dir=None, in_memory=None,
+                 streaming_overviews=None, compress=None, compress_level=None, bands_compress=None,
+                 s3_bucket=None, s3_prefix=None, s3_endpoint_url=None, s3_max_concurrency=None,
+                 ledger_checksums=None):
         self.nonpym_list = nonpym_list
         self.black_list = black_list
         self.white_list = white_list
@@ -85,6 +132,16 @@ class COGNetCDF:
         else:
             self.default_rsp = default_rsp
         self.bands_rsp = bands_rsp
+        if compress is None:
+            self.compress = 'DEFLATE'
+        else:
+            self.compress = compress.upper()
+        if compress_level is None and self.compress == 'DEFLATE':
+            self.compress_level = 9
+        else:
+            self.compress_level = compress_level
+        # Codec settings of some bands, by band name: compress, level, predictor and/or max_z_error
+        self.bands_compress = bands_compress
         if dest_template is None:
             self.dest_template = "x_{x}/y_{y}/{year}"
         else:
@@ -93,49 +150,59 @@ class COGNetCDF:
             self.src_template = "{x}_{y}_{time}"
         else:
             self.src_template = src_template
+        # Parsed templates, shared by all the files of the product
+        self.naming = OutputNaming(self.src_template, self.dest_template)
+        if band_workers is None:
+            self.band_workers = 1
+        else:
+            self.band_workers = band_workers
+        # Memory cap (in MiB) shared by all bands encoded concurrently from one file
+        self.band_memory_limit = band_memory_limit
+        # Where rasters too large to stage in memory are spilled (None: system temporary directory)
+        self.scratch_dir = scratch_dir
+        # None lets cog_translate choose from the raster size
+        self.in_memory = in_memory
+        # Build the overviews while the blocks are written, instead of reading them back
+        self.streaming_overviews = bool(streaming_overviews)
+        # Bytes of COGs and YAMLs written by this converter
+        self.bytes_written = 0
+        # Upload the outputs to a bucket rather than writing them under the output directory
+        if s3_bucket is not None:
+            self.storage = S3Storage(s3_bucket, s3_prefix or '', s3_endpoint_url,
+                                     max_concurrency=s3_max_concurrency or 8,
+                                     max_connections=(s3_max_concurrency or 8) * self.band_workers)
+        else:
+            self.storage = None
+        self.dest_dir = None
+        # Size and MD5 checksum of the COGs uploaded, by output path
+        self.uploaded = {}
+        # Record the MD5 checksum of local outputs in the ledger, at the cost of reading them back
+        self.ledger_checksums = bool(ledger_checksums)
 
     def __call__(self, input_fname, dest_dir):
-        prefix_name = self._make_out_prefix(input_fname, dest_dir)
-        self.netcdf_to_cog(input_fname, prefix_name)
+        self.dest_dir = dest_dir
+        with timing.file_stage(input_fname):
+            prefix_name = self._make_out_prefix(input_fname, dest_dir)
+            self.netcdf_to_cog(input_fname, prefix_name)
 
     def _make_out_prefix(self, input_fname, dest_dir):
-        abs_fname = basename(input_fname)
-        prefix_name = re.search(r"[-\w\d.]*(?=\.\w)", abs_fname).group(0)
-        r = re.compile(r"(?<=_)[-\d.]+")
-        indices = r.findall(prefix_name)
-        r = re.compile(r"(?<={)\w+")
-        key_indices = r.findall(self.src_template)
-        keys = r.findall(self.dest_template)
-        if len(indices) > len(key_indices):
-            indices = indices[-len(key_indices):]
-
-        if len(key_indices) > 3:
-            indices = indices[-len(key_indices): -(len(key_indices) - 3)]
-        else:
-            indices += [None] * (3 - len(indices))
-            x_index, y_index, date_time = indices
-
-        dest_dict = {keys[0]: x_index, keys[1]: y_index}
-        if date_time is not None:
-            year = re.search(r"\d{4}", date_time)
-            month = re.search(r'(?<=\d{4})\d{2}', date_time)
-            day = re.search(r'(?<=\d{6})\d{2}', date_time)
-            time = re.search(r'(?<=\d{8})\d+', date_time)
-            if year is not None and len(keys) >= 3:
-                dest_dict[keys[2]] = year.group(0)
-            if month is not None and len(keys) >= 4:
-                dest_dict[keys[3]] = month.group(0)
-            if day is not None and len(keys) >= 5:
-                dest_dict[keys[4]] = day.group(0)
-            if time is not None and len(keys) >= 6:
-                dest_dict[keys[5]] = time.group(0)
-        else:
-            self.dest_template = '/'.join(self.dest_template.split('/')[0:2])
+        return self.naming.prefix(input_fname, dest_dir)
 
-        out_dir = pjoin(dest_dir, self.dest_template.format(**dest_dict))
-        os.makedirs(out_dir, exist_ok=True)
+    def _stored_size(self, out_fname):
+        """
+        Size of an output where it is stored, or None if it is missing
+        """
+        if self.storage is None:
+            return os.path.getsize(out_fname) if exists(out_fname) else None
+        return self.storage.size(self.storage.key(out_fname, self.dest_dir))
+
+    def _upload(self, fileobj, out_fname, content_type):
+        size, md5 = self.storage.upload(fileobj, self.storage.key(out_fname, self.dest_dir), content_type)
+        self.uploaded[out_fname] = (size, md5)
+        return size
 
-        return pjoin(out_dir, prefix_name)
+    def _upload_cog(self, fileobj, out_fname):
+        self._upload(fileobj, out_fname, 'image/tiff')
 
     def netcdf_to_cog(self, input_file, prefix):
         """
@@ -157,63 +224,93 @@ class COGNetCDF:
         subdatasets = dataset.GetSubDatasets()
 
         # Extract each band from the NetCDF and write to individual GeoTIFF files
-        rastercount = self._dataset_to_cog(prefix, subdatasets)
+        with timing.stage('dataset_to_cog'):
+            rastercount = self._dataset_to_cog(prefix, subdatasets, input_file)
 
-        dataset_array = xarray.open_dataset(input_file)
-        self._dataset_to_yaml(prefix, dataset_array, rastercount)
+        with timing.stage('dataset_to_yaml'):
+            self._dataset_to_yaml(prefix, input_file, rastercount)
         # Clean up XML files from GDAL
         # GDAL creates extra XML files which we don't want
 
-    def _dataset_to_yaml(self, prefix, dataset_array: xarray.Dataset, rastercount):
+    def _dataset_to_yaml(self, prefix, input_file, rastercount):
         """
         Write the datasets to separate yaml files
+
+        Only the documents of the yamls not written yet are read and parsed.
         """
-        for i in range(rastercount):
+        if rastercount == 1:
+            yaml_fnames = [prefix + '.yaml']
+        else:
+            yaml_fnames = [prefix + '_' + str(i + 1) + '.yaml' for i in range(rastercount)]
+
+        with ExitStack() as stack:
+            if self.storage is not None:
+                # Objects are checked and uploaded concurrently, each a round trip
+                executor = stack.enter_context(
+                    ThreadPoolExecutor(max_workers=self.storage.transfer_config.max_concurrency))
+                map_outputs = executor.map
+            else:
+                map_outputs = map
+
+            pending = [i for i, size in enumerate(map_outputs(self._stored_size, yaml_fnames)) if size is None]
+            if not pending:
+                return
+
+            documents = []
+            for i, dataset_object in zip(pending, _read_dataset_documents(input_file, pending)):
+                dataset = yaml.load(dataset_object, Loader=Loader)
+                if dataset is None:
+                    LOG.info("No yaml section %s", prefix)
+                    continue
+                self._update_dataset(dataset, prefix, i, rastercount)
+                documents.append((yaml_fnames[i],
+                                  yaml.dump(dataset, default_flow_style=False, Dumper=Dumper).encode('utf-8')))
+
+            if documents:
+                self.bytes_written += sum(map_outputs(self._write_yaml, *zip(*documents)))
+
+    def _update_dataset(self, dataset, prefix, i, rastercount):
+        """
+        Point the bands of the dataset document of time slice 'i' to their COGs
+        """
+        invalid_band = []
+        # Update band urls
+        for key, value in dataset['image']['bands'].items():
+            if self.black_list is not None:
+                if re.search(self.black_list, key) is not None:
+                    invalid_band.append(key)
+                    continue
+
+            if self.white_list is not None:
+                if re.search(self.white_list, key) is None:
+                    invalid_band.append(key)
+                    continue
+
             if rastercount == 1:
-                yaml_fname = prefix + '.yaml'
-                dataset_object = (dataset_array.dataset.item()).decode('utf-8')
+                tif_path = basename(prefix + '_' + key + '.tif')
             else:
-                yaml_fname = prefix + '_' + str(i + 1) + '.yaml'
-                dataset_object = (dataset_array.dataset.item(i)).decode('utf-8')
+                tif_path = basename(prefix + '_' + key + '_' + str(i + 1) + '.tif')
 
-            if exists(yaml_fname):
-                continue
+            value['layer'] = str(i + 1)
+            value['path'] = tif_path
 
-            dataset = yaml.load(dataset_object, Loader=Loader)
-            if dataset is None:
-                LOG.info("No yaml section %s", prefix)
-                continue
+        for band in invalid_band:
+            dataset['image']['bands'].pop(band)
 
-            invalid_band = []
-            # Update band urls
-            for key, value in dataset['image']['bands'].items():
-                if self.black_list is not None:
-                    if re.search(self.black_list, key) is not None:
-                        invalid_band.append(key)
-                        continue
-
-                if self.white_list is not None:
-                    if re.search(self.white_list, key) is None:
-                        invalid_band.append(key)
-                        continue
-
-                if rastercount == 1:
-                    tif_path = basename(prefix + '_' + key + '.tif')
-                else:
-                    tif_path = basename(prefix + '_' + key + '_' + str(i + 1) + '.tif')
+        dataset['format'] = {'name': 'GeoTIFF'}
+        dataset['lineage'] = {'source_datasets': {}}
 
-                value['layer'] = str(i + 1)
-                value['path'] = tif_path
-
-            for band in invalid_band:
-                dataset['image']['bands'].pop(band)
+    def _write_yaml(self, yaml_fname, document):
+        """
+        Store a yaml document, and return its size
+        """
+        if self.storage is not None:
+            return self._upload(io.BytesIO(document), yaml_fname, 'text/yaml')
 
-            dataset['format'] = {'name': 'GeoTIFF'}
-            dataset['lineage'] = {'source_datasets': {}}
-            with open(yaml_fname, 'w') as fp:
-                yaml.dump(dataset, fp, default_flow_style=False, Dumper=Dumper)
+        # Write then rename, so that an existing yaml is always complete
+        return write_replacing(yaml_fname, document)
 
-    def _dataset_to_cog(self, prefix, subdatasets):
+    def _dataset_to_cog(self, prefix, subdatasets, input_file):
         """
         Write the datasets to separate cog files
         """
@@ -228,58 +325,124 @@ class COGNetCDF:
             self.nonpym_list = "|".join(self.nonpym_list)
 
         rastercount = 0
-        for dts in subdatasets[:-1]:
-            rastercount = gdal.Open(dts[0]).RasterCount
-            for i in range(rastercount):
-                band_name = dts[0].split(':')[-1]
-
-                # Only do specified bands if specified
-                if self.black_list is not None:
-                    if re.search(self.black_list, band_name) is not None:
-                        continue
-
-                if self.white_list is not None:
-                    if re.search(self.white_list, band_name) is None:
-                        continue
-
-                if rastercount == 1:
-                    out_fname = prefix + '_' + band_name + '.tif'
-                else:
-                    out_fname = prefix + '_' + band_name + '_' + str(i + 1) + '.tif'
-
-                # Check the done files might need a force option later
-                if exists(out_fname):
-                    if self._check_tif(out_fname):
-                        continue
-
-                # Resampling method of this band
-                resampling_method = None
-                if self.bands_rsp is not None:
-                    resampling_method = self.bands_rsp.get(band_name)
-                if resampling_method is None:
-                    resampling_method = self.default_rsp
-                if self.nonpym_list is not None:
-                    if re.search(self.nonpym_list, band_name) is not None:
-                        resampling_method = None
-
-                default_profile = {'driver': 'GTiff',
-                                   'interleave': 'pixel',
-                                   'tiled': True,
-                                   'blockxsize': 512,
-                                   'blockysize': 512,
-                                   'compress': 'DEFLATE',
-                                   'predictor': self.predictor,
-                                   'zlevel': 9}
-
-                cog_translate(dts[0], out_fname,
-                              default_profile,
-                              indexes=[i + 1],
-                              overview_resampling=resampling_method,
-                              overview_level=5,
-                              config=DEFAULT_GDAL_CONFIG)
+        band_nbytes = 0
+        bands = []
+        ledger = CompletionLedger.for_prefix(prefix, self.ledger_checksums)
+        with ExitStack() as stack:
+            stack.enter_context(rasterio.Env(**DEFAULT_GDAL_CONFIG))
+            for dts in subdatasets[:-1]:
+                # Each subdataset is opened once; the handle serves the band count,
+                # the nodata value and all the pixel reads
+                src = stack.enter_context(rasterio.open(dts[0]))
+                rastercount = src.count
+                band_nbytes = max(band_nbytes, self._band_nbytes(src))
+                self._subdataset_bands(src, dts[0], prefix, rastercount, bands, input_file, ledger)
+
+            if bands:
+                # The source rows buffered by the readers come out of the same budget as the rasters
+                buffer_limit = STRIP_BUFFER_LIMIT
+                in_memory = self.in_memory
+                if self.band_memory_limit is not None:
+                    buffer_limit = min(buffer_limit, self.band_memory_limit * 1024 ** 2 // 4)
+                    if in_memory is None:
+                        in_memory = band_nbytes * len(bands) + buffer_limit <= self.band_memory_limit * 1024 ** 2
+                cog_translate_many(bands,
+                                   overview_level=5,
+                                   config=DEFAULT_GDAL_CONFIG,
+                                   in_memory=in_memory,
+                                   temp_dir=self.scratch_dir,
+                                   max_workers=self._band_concurrency(band_nbytes, len(bands)),
+                                   streaming_overviews=self.streaming_overviews,
+                                   upload=self._upload_cog if self.storage is not None else None,
+                                   buffer_limit=buffer_limit)
+                for band in bands:
+                    output_size, output_md5 = self.uploaded.pop(band['dst_path'], (None, None))
+                    ledger.record(band['dst_path'], input_file, output_size, output_md5)
+                    self.bytes_written += output_size or os.path.getsize(band['dst_path'])
 
         return rastercount
 
+    def _subdataset_bands(self, src, subdataset, prefix, rastercount, bands, input_file, ledger):
+        """
+        Append the outputs still to be converted from an open subdataset to 'bands'
+        """
+        for i in range(rastercount):
+            band_name = subdataset.split(':')[-1]
+
+            # Only do specified bands if specified
+            if self.black_list is not None:
+                if re.search(self.black_list, band_name) is not None:
+                    continue
+
+            if self.white_list is not None:
+                if re.search(self.white_list, band_name) is None:
+                    continue
+
+            if rastercount == 1:
+                out_fname = prefix + '_' + band_name + '.tif'
+            else:
+                out_fname = prefix + '_' + band_name + '_' + str(i + 1) + '.tif'
+
+            # Check the done files might need a force option later
+            if ledger.is_complete(out_fname, input_file, self._stored_size):
+                continue
+            if self.storage is None and basename(out_fname) not in ledger.entries and exists(out_fname):
+                # Outputs written before the ledger existed are checked once, then recorded. Those recorded
+                # from another version of the source are rebuilt
+                if self._check_tif(out_fname):
+                    ledger.record(out_fname, input_file)
+                    continue
+
+            # Resampling method of this band
+            resampling_method = None
+            if self.bands_rsp is not None:
+                resampling_method = self.bands_rsp.get(band_name)
+            if resampling_method is None:
+                resampling_method = self.default_rsp
+            if self.nonpym_list is not None:
+                if re.search(self.nonpym_list, band_name) is not None:
+                    resampling_method = None
+
+            bands.append({'src': src,
+                          'indexes': [i + 1],
+                          'dst_path': out_fname,
+                          'dst_kwargs': self._band_profile(band_name),
+                          'overview_resampling': resampling_method})
+
+    def _band_profile(self, band_name):
+        """
+        Creation options of the COGs of a band
+        """
+        codec = {'compress': self.compress, 'level': self.compress_level, 'predictor': self.predictor}
+        codec = merge_codecs(codec, (self.bands_compress or {}).get(band_name))
+
+        profile = {'driver': 'GTiff',
+                   'interleave': 'pixel',
+                   'tiled': True,
+                   'blockxsize': 512,
+                   'blockysize': 512}
+        profile.update(compression_options(**codec))
+        return profile
+
+    @staticmethod
+    def _band_nbytes(src):
+        """
+        Estimate the memory needed to encode one band of a rasterio dataset, overviews included,
+        and the block of source pixels read for it at a time
+        """
+        # Byte bands with a negative nodata are promoted to int16 by cog_translate
+        itemsize = max(np.dtype(src.dtypes[0]).itemsize, 2)
+        return src.width * src.height * itemsize * 4 // 3 + 512 * 512 * itemsize
+
+    def _band_concurrency(self, band_nbytes, num_jobs):
+        """
+        Number of bands to encode at the same time, bounded by the per-file memory cap
+        """
+        workers = min(self.band_workers, num_jobs)
+        if self.band_memory_limit is not None and band_nbytes > 0:
+            workers = min(workers, max(1, (self.band_memory_limit * 1024 ** 2) // band_nbytes))
+        return max(1, workers)
+
     @staticmethod
     def _check_tif(fname):
         try:
@@ -306,6 +469,33 @@ class COGProductConfiguration:
         self.cfg = cfg
 
 
+def _read_dataset_documents(input_file, indexes):
+    """
+    Read the dataset documents of the given time slices of a NetCDF file, in the order of 'indexes'
+
+    Only the 'dataset' variable is read, in a single read covering all the slices, and nothing is decoded but the
+    documents.
+    """
+    with netCDF4.Dataset(input_file) as nco:
+        var = nco.variables['dataset']
+        var.set_auto_maskandscale(False)
+        var.set_auto_chartostring(False)
+        if var.dtype == 'S1' and var.ndim == 1:
+            # A single document, without time dimension
+            rows = var[:][np.newaxis]
+            first = 0
+        else:
+            first = min(indexes)
+            rows = var[first:max(indexes) + 1]
+
+    for i in indexes:
+        row = rows[i - first]
+        if isinstance(row, str):
+            yield row
+        else:
+            yield row.tobytes().rstrip(b'\0').decode('utf-8')
+
+
 def get_indexed_files(product, year=None, month=None, datacube_env=None):
     """
     Extract the file list corresponding to a product for the given year and month using datacube API.
@@ -357,6 +547,32 @@ def get_indexed_files(product, year=None, month=None, from_date=None, datacube_e
     return set(filename_from_uri(uri) for uri in files)
 
 
+def get_changed_files(product, watermark, year=None, month=None, from_date=None, datacube_env=None):
+    """
+    Yield in order the files of a product with datasets added to the index since the watermark,
+    and move the watermark past them.
+    """
+    time_range = None
+    if from_date:
+        time_range = (datetime(year=from_date.year, month=from_date.month, day=from_date.day), datetime.now())
+    elif year and month:
+        time_range = (datetime(year=year, month=month, day=1),
+                      datetime(year=year + month // 12, month=month % 12 + 1, day=1))
+    elif year:
+        time_range = (datetime(year=year, month=1, day=1), datetime(year=year + 1, month=1, day=1))
+    engine = index_engine(datacube_env, 'streamer')
+
+    last = None
+    for row in search_datasets(engine, product, ('uri',), time_range, watermark.since):
+        if not watermark.is_new(row.uri, row.added):
+            continue
+        watermark.observe(row.uri, row.added)
+        filename = row.uri.split('//')[1]
+        if filename != last:
+            yield filename
+            last = filename
+
+
 def netcdf_cog_worker(wargs=None):
     """
     Convert a list of NetCDF files into Cloud Optimise GeoTIFF format using MPI
@@ -364,6 +580,62 @@ def netcdf_cog_worker(wargs=None):
     """
     netcdf_cog_fp = COGNetCDF(**list(wargs)[0])
     netcdf_cog_fp(list(wargs)[1], list(wargs)[2])
+    return netcdf_cog_fp.bytes_written
+
+
+def _raise_task_timeout(signum, frame):
+    raise TaskTimeoutError('Task timed out')
+
+
+def run_task(task, timeout=None):
+    """
+    Run netcdf_cog_worker on a task, catching any failure
+
+    Returns the duration of the task, its error message (None on success) and the
+    number of bytes it wrote. The timeout is enforced with SIGALRM, which interrupts Python code but not a
+    GDAL call in progress; the master watches for workers stuck in one.
+    """
+    start = time.perf_counter()
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_task_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    bytes_written = 0
+    try:
+        bytes_written = netcdf_cog_worker(wargs=task)
+        error = None
+    except Exception as e:
+        LOG.exception(f"Worker ({MPI_JOB_RANK}/{os.getpid()}) failed to convert {task[1]}")
+        error = f'{type(e).__name__}: {e}'
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return time.perf_counter() - start, error, bytes_written
+
+
+def estimate_task_cost(filename, probe=False):
+    """
+    Estimate the relative cost of converting a NetCDF file
+
+    The cost is the file size, or with 'probe' the number of pixels over all its
+    subdatasets, read from the NetCDF header.
+    """
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        return 0
+    if not probe:
+        return size
+
+    dataset = gdal.Open(filename, gdal.GA_ReadOnly)
+    if dataset is None:
+        return size
+    subdatasets = dataset.GetSubDatasets()[:-1]
+    if not subdatasets:
+        return size
+    band = gdal.Open(subdatasets[0][0], gdal.GA_ReadOnly)
+    if band is None:
+        return size
+    return len(subdatasets) * band.RasterXSize * band.RasterYSize * band.RasterCount
 
 
 def _raise_value_err(exp):
@@ -381,39 +653,114 @@ def cli():
 @click.option('--month', '-m', type=int, help="The month")
 @click.option('--from-date', callback=check_date, help="The date from which the dataset time")
 @click.option('--output_dir', '-o', help='The list will be saved to this directory')
-def generate_work_list(product_name, year, month, from_date, output_dir):
+@click.option('--since-last-run', is_flag=True,
+              help="Only list the files with datasets added to the index since the last run with this option")
+@click.option('--watermark-dir', type=click.Path(file_okay=False), default=str(WATERMARK_DIR), show_default=True,
+              help="Where the per-product watermarks of --since-last-run are kept")
+def generate_work_list(product_name, year, month, from_date, output_dir, since_last_run, watermark_dir):
     """
     Connect to an ODC database and list NetCDF files
     """
 
     # get file list
-    items_all = get_indexed_files(product_name, year, month, from_date, 'dea-prod')
+    if since_last_run:
+        watermark = Watermark(product_name, watermark_dir, scope_name(year, month, from_date))
+        items_all = get_changed_files(product_name, watermark, year, month, from_date, 'dea-prod')
+    else:
+        items_all = sorted(get_indexed_files(product_name, year, month, from_date, 'dea-prod'))
 
     out_file = Path(output_dir) / 'file_list'
     with open(out_file, 'w') as fp:
-        for item in sorted(items_all):
+        for item in items_all:
             fp.write(item + '\n')
 
+    if since_last_run:
+        watermark.save(out_file)
+
 
 @cli.command(name='mpi-convert-cog')
 @click.option('--config', '-c', help='Config file')
 @click.option('--output-dir', help='Output directory', required=True)
 @click.option('--product', help='Product name', required=True)
 @click.option('--numprocs', type=int, help='Number of processes', required=True, default=1)
+@click.option('--band-workers', type=int, help='Number of bands of a file encoded concurrently')
+@click.option('--band-memory-limit', type=int, help='Memory cap (MiB) for the bands of a file encoded concurrently')
+@click.option('--scratch-dir', envvar='PBS_JOBFS', type=click.Path(exists=True, file_okay=False),
+              help='Local scratch directory for rasters too large to stage in memory (default: $PBS_JOBFS)')
+@click.option('--batch-size', type=int, default=1, show_default=True,
+              help='Number of files assigned to a worker per message')
+@click.option('--prefetch/--no-prefetch', default=True, show_default=True,
+              help='Request the next batch of files while converting the current one')
+@click.option('--scheduler', type=click.Choice(['master', 'counter']), default='master', show_default=True,
+              help='Hand out files from rank 0, or let every rank claim them from a shared MPI counter')
+@click.option('--schedule', type=click.Choice(['fifo', 'lpt']), default='fifo', show_default=True,
+              help='Dispatch files in file-list order, or largest estimated cost first')
+@click.option('--probe-headers', is_flag=True,
+              help='Estimate costs from the NetCDF headers (subdatasets and raster size) instead of file sizes')
+@click.option('--schedule-report', type=click.Path(dir_okay=False, writable=True),
+              help='Write the predicted and actual makespan and per-file costs and durations to this JSON file')
+@click.option('--max-retries', type=int, default=2, show_default=True,
+              help='Number of times a failed file is retried')
+@click.option('--task-timeout', type=float, help='Time limit (seconds) for converting one file')
+@click.option('--failed-list', type=click.Path(dir_okay=False, writable=True),
+              help='Write the files which could not be converted to this file (default: OUTPUT_DIR/failed_files)')
+@click.option('--metrics-file', type=click.Path(dir_okay=False, writable=True),
+              help='Append per-stage timing records (JSON Lines) to this file')
+@click.option('--profile-dir', type=click.Path(file_okay=False, writable=True),
+              help='Profile each file with cProfile and keep the profiles of the slowest ones in this directory')
+@click.option('--profile-slowest', type=int, default=10, show_default=True,
+              help='Number of profiles kept by each process with --profile-dir')
+@click.option('--telemetry-dir', type=click.Path(file_okay=False, writable=True),
+              help='Directory where the master keeps live throughput metrics (JSON and Prometheus textfile)')
+@click.option('--telemetry-interval', type=float, default=30, show_default=True,
+              help='Seconds between two updates of the live throughput metrics')
+@click.option('--s3-bucket', help='Upload the COGs and YAMLs to this S3 bucket instead of writing them under '
+                                   'the output directory (which keeps the completion ledgers)')
+@click.option('--s3-endpoint-url', help='Endpoint of an S3-compatible object store (e.g. MinIO)')
+@click.option('--aws-product', help='Product of aws_products_config.yaml giving the key prefix (default: --product)')
 @click.argument('filelist', nargs=1, required=True)
-def mpi_convert_cog(config, output_dir, product, numprocs, filelist):
+def mpi_convert_cog(config, output_dir, product, numprocs, band_workers, band_memory_limit, scratch_dir,
+                    batch_size, prefetch, scheduler, schedule, probe_headers, schedule_report, max_retries,
+                    task_timeout, failed_list, metrics_file, profile_dir, profile_slowest, telemetry_dir,
+                    telemetry_interval, s3_bucket, s3_endpoint_url, aws_product, filelist):
     """
     Parallelise COG convert using MPI
     Iterate over filename and output dir as job argument
     """
-    global MPI_COMM, MPI_JOB_SIZE, MPI_JOB_RANK
+    _init_mpi()
+    timing.configure(metrics_file, profile_dir, profile_slowest)
 
-    if config:
-        with open(config) as cfg_file:
-            cfg = yaml.load(cfg_file)
+    file_list = _read_file_list(filelist)
+    product_config = _product_config(config, product, band_workers, band_memory_limit, scratch_dir,
+                                     s3_bucket, s3_endpoint_url, aws_product)
+    num_workers = numprocs if numprocs > 0 else _raise_value_err(
+        f"MPI Worker ({MPI_JOB_RANK}): Number of processes cannot be zero")
+    if batch_size < 1:
+        _raise_value_err(f"MPI Worker ({MPI_JOB_RANK}): Batch size must be at least one")
+    if failed_list is None:
+        failed_list = pjoin(output_dir, 'failed_files')
+
+    # Ensure all errors/exceptions are handled before this, else master-worker processes
+    # will enter a dead-lock situation
+    job_args, costs = _plan_tasks_mpi(file_list, product_config, output_dir, schedule, probe_headers)
+    if scheduler == 'counter':
+        # Every rank converts files, claiming them from a shared counter over the same task list
+        _mpi_counter(job_args, costs, batch_size, schedule_report, max_retries, task_timeout, failed_list)
+    elif MPI_JOB_RANK == 0:
+        monitor = None
+        if telemetry_dir:
+            total_bytes = sum(os.path.getsize(task[1]) for task in job_args if exists(task[1]))
+            monitor = ThroughputMonitor(telemetry_dir, len(job_args), total_bytes, telemetry_interval)
+        _mpi_master(job_args, costs, num_workers, batch_size, schedule_report, max_retries, task_timeout,
+                    failed_list, monitor)
     else:
-        cfg = yaml.load(DEFAULT_CONFIG)
+        _mpi_worker(prefetch, task_timeout)
 
+
+def _read_file_list(filelist):
+    """
+    Read the NetCDF file names of a file list
+    """
     try:
         with open(filelist) as fb:
             file_list = np.genfromtxt(fb, dtype='str')
@@ -424,66 +771,653 @@ def mpi_convert_cog(config, output_dir, product, numprocs, filelist):
     else:
         if tasks == 0:
             _raise_value_err(f'MPI Worker ({MPI_JOB_RANK}): No netCDF file/s found in the input path')
+    return file_list
 
-    product_config = cfg['products'][product]
-    num_workers = numprocs if numprocs > 0 else _raise_value_err(
-        f"MPI Worker ({MPI_JOB_RANK}): Number of processes cannot be zero")
 
-    # Ensure all errors/exceptions are handled before this, else master-worker processes
-    # will enter a dead-lock situation
+def _product_config(config, product, band_workers=None, band_memory_limit=None, scratch_dir=None,
+                    s3_bucket=None, s3_endpoint_url=None, aws_product=None):
+    """
+    Load the configuration of a product, overridden by the command line options
+    """
+    if config:
+        with open(config) as cfg_file:
+            cfg = yaml.load(cfg_file)
+    else:
+        cfg = yaml.load(DEFAULT_CONFIG)
+
+    product_config = dict(cfg['products'][product])
+    if band_workers is not None:
+        product_config['band_workers'] = band_workers
+    if band_memory_limit is not None:
+        product_config['band_memory_limit'] = band_memory_limit
+    if scratch_dir is not None:
+        product_config['scratch_dir'] = scratch_dir
+    if s3_bucket is not None:
+        product_config['s3_bucket'] = s3_bucket
+    if s3_endpoint_url is not None:
+        product_config['s3_endpoint_url'] = s3_endpoint_url
+    if product_config.get('s3_bucket') and product_config.get('s3_prefix') is None:
+        # The key prefix of the product in the public bucket
+        with open(AWS_PRODUCTS_CONFIG) as fd:
+            aws_products = yaml.safe_load(fd)['products']
+        product_config['s3_prefix'] = aws_products[aws_product or product]['prefix']
+    return product_config
+
+
+def _plan_tasks(file_list, product_config, output_dir, schedule, probe_headers, map_costs=map):
+    """
+    Build the job arguments of each file, in dispatch order, with their estimated costs
+
+    See _estimate_costs for 'map_costs'; with 'probe_headers' and MPI initialised, this is a collective call.
+    """
+    job_args = []
+
+    # Append the jobs_args list for each filename to be scheduled among all the available workers
+    if file_list.size == 1:
+        job_args = [(product_config, str(file_list), output_dir)]
+    elif file_list.size > 1:
+        for filename in file_list:
+            job_args.extend([(product_config, str(filename), output_dir)])
+
+    costs = _estimate_costs([task[1] for task in job_args], probe_headers, map_costs)
+    if schedule == 'lpt':
+        # Longest processing time first, so that no large file is left to the end
+        order = lpt_order(costs)
+        job_args = [job_args[k] for k in order]
+        costs = [costs[k] for k in order]
+
+    return job_args, costs
+
+
+def _plan_tasks_mpi(file_list, product_config, output_dir, schedule, probe_headers):
+    """
+    Plan the tasks on all the ranks: the headers are probed by all of them, file sizes only by rank 0
+    """
+    if probe_headers:
+        # Each rank ends up with the same costs, hence the same order
+        return _plan_tasks(file_list, product_config, output_dir, schedule, probe_headers)
+    planned = _plan_tasks(file_list, product_config, output_dir, schedule, probe_headers) \
+        if MPI_JOB_RANK == 0 else None
+    return MPI_COMM.bcast(planned, root=0)
+
+
+def _estimate_costs(filenames, probe=False, map_costs=map):
+    """
+    Estimate the cost of converting each file (see estimate_task_cost)
+
+    With 'probe', the headers are read with 'map_costs' (e.g. the map of a process pool), or once MPI is
+    initialised by all the ranks together, each probing a share of the files, rather than by one process.
+    """
+    if not probe:
+        return [estimate_task_cost(filename) for filename in filenames]
+    if MPI_COMM is None or MPI_JOB_SIZE == 1:
+        return list(map_costs(_probe_task_cost, filenames))
+
+    costs = [0] * len(filenames)
+    share = {k: estimate_task_cost(filenames[k], probe=True)
+             for k in range(MPI_JOB_RANK, len(filenames), MPI_JOB_SIZE)}
+    for rank_costs in MPI_COMM.allgather(share):
+        for k, cost in rank_costs.items():
+            costs[k] = cost
+    return costs
+
+
+def _probe_task_cost(filename):
+    return estimate_task_cost(filename, probe=True)
+
+
+def _mpi_counter(job_args, costs, batch_size, schedule_report=None, max_retries=0, task_timeout=None,
+                 failed_list=None):
+    """
+    Convert batches of tasks claimed from a counter shared by all the ranks
+
+    The counter lives in a one-sided communication window of rank 0 and is
+    advanced with an atomic fetch-and-add, so no rank is dedicated to handing
+    out tasks. A rank exits once the counter has run past the task list.
+    Failed tasks are retried in place up to 'max_retries' times.
+    """
+    proc_name = MPI.Get_processor_name()
+    tasks = len(job_args)
+    itemsize = MPI.INT64_T.Get_size()
+    win = MPI.Win.Allocate(itemsize if MPI_JOB_RANK == 0 else 0, itemsize, comm=MPI_COMM)
     if MPI_JOB_RANK == 0:
-        name = MPI.Get_processor_name()
-        task_index = 0
-        closed_workers = 0
-        job_args = []
-        LOG.debug(f"MPI Master ({MPI_JOB_RANK}) on {name} node, starting with {num_workers} workers")
-
-        # Append the jobs_args list for each filename to be scheduled among all the available workers
-        if tasks == 1:
-            job_args = [(product_config, str(file_list), output_dir)]
-        elif tasks > 1:
-            for filename in file_list:
-                job_args.extend([(product_config, str(filename), output_dir)])
-
-        while closed_workers < num_workers:
-            MPI_COMM.recv(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=MPI_JOB_STATUS)
-            source = MPI_JOB_STATUS.Get_source()
-            tag = MPI_JOB_STATUS.Get_tag()
-
-            if tag == TagStatus.READY:
-                # Worker is ready, so assign a task
-                if task_index < tasks:
-                    MPI_COMM.send(job_args[task_index], dest=source, tag=TagStatus.START)
-                    LOG.debug("MPI Master (%d) assigning task to worker (%d): Process %r file" % (MPI_JOB_RANK,
-                                                                                                  source,
-                                                                                                  job_args[task_index]))
-                    task_index += 1
-                else:
-                    MPI_COMM.send(None, dest=source, tag=TagStatus.EXIT)
-            elif tag == TagStatus.DONE:
-                LOG.debug(f"MPI Worker ({source}) on {name} completed the assigned task")
-            elif tag == TagStatus.EXIT:
-                LOG.debug(f"MPI Worker ({source}) exited")
-                closed_workers += 1
+        # Allocated window memory is not initialised
+        win.Lock(0)
+        win.Put(np.zeros(1, dtype=np.int64), 0)
+        win.Unlock(0)
+    MPI_COMM.Barrier()
+
+    start_time = time.time()
+    increment = np.array([batch_size], dtype=np.int64)
+    claimed = np.zeros(1, dtype=np.int64)
+    durations = {}
+    failed = {}
+    while True:
+        win.Lock(0)
+        win.Fetch_and_op(increment, claimed, 0, op=MPI.SUM)
+        win.Unlock(0)
+        task_index = int(claimed[0])
+        if task_index >= tasks:
+            break
+
+        batch = job_args[task_index:task_index + batch_size]
+        LOG.debug(f"MPI Worker ({MPI_JOB_RANK}) on {proc_name} claimed {len(batch)} file(s) from task {task_index}")
+        for task in batch:
+            for attempt in range(max_retries + 1):
+                duration, error, _ = run_task(task, task_timeout)
+                if error is None:
+                    durations[task[1]] = duration
+                    break
+                LOG.warning(f"MPI Worker ({MPI_JOB_RANK}) attempt {attempt + 1} on {task[1]} failed: {error}")
+            else:
+                failed[task[1]] = error
+
+    LOG.debug(f"MPI Worker ({MPI_JOB_RANK}) processed {len(durations)} file(s), no task left")
+    MPI_COMM.Barrier()
+    win.Free()
 
+    all_durations = MPI_COMM.gather(durations, root=0)
+    all_failed = MPI_COMM.gather(failed, root=0)
+    if MPI_JOB_RANK == 0:
+        for rank_durations in all_durations:
+            durations.update(rank_durations)
+        for rank_failed in all_failed:
+            failed.update(rank_failed)
+        _write_failed_list(failed, failed_list)
+        _report_makespan(job_args, costs, durations, MPI_JOB_SIZE, time.time() - start_time, schedule_report)
         LOG.debug("Batch processing completed")
-    else:
-        proc_name = MPI.Get_processor_name()
 
-        while True:
+
+def _mpi_master(job_args, costs, num_workers, batch_size, schedule_report=None, max_retries=0,
+                task_timeout=None, failed_list=None, monitor=None):
+    """
+    Hand out batches of 'batch_size' tasks to the workers until all are done
+
+    'costs' are the estimated costs of the tasks, used to report the predicted makespan
+    against the actual one.
+
+    Tasks reported FAILED are re-queued up to 'max_retries' times. With 'task_timeout',
+    a worker silent for longer than the timeouts of its outstanding tasks is considered
+    hung: its tasks are re-queued and it is no longer waited for. Files which never
+    succeed are written to 'failed_list'.
+
+    A worker asking for tasks when none are queued is held while other tasks are
+    outstanding, as they may still fail and be re-queued, and only told to exit once
+    nothing is left.
+
+    Progress is published through 'monitor', a telemetry.ThroughputMonitor, if given.
+    """
+    name = MPI.Get_processor_name()
+    tasks = len(job_args)
+    task_index = 0
+    retry_queue = deque()
+    attempts = {}
+    failed = {}
+    outstanding = {}
+    last_seen = {}
+    lost_workers = set()
+    closed_workers = 0
+    idle_workers = []
+    pending_sends = []
+    dispatch_latency = []
+    durations = {}
+    start_time = time.time()
+    LOG.debug(f"MPI Master ({MPI_JOB_RANK}) on {name} node, starting with {num_workers} workers")
+
+    def fail_task(k, error):
+        attempts[k] = attempts.get(k, 0) + 1
+        if attempts[k] <= max_retries:
+            LOG.warning("MPI Master (%d) re-queueing %s (attempt %d failed: %s)" %
+                        (MPI_JOB_RANK, job_args[k][1], attempts[k], error))
+            retry_queue.append(k)
+        else:
+            LOG.error("MPI Master (%d) giving up on %s: %s" % (MPI_JOB_RANK, job_args[k][1], error))
+            failed[job_args[k][1]] = error
+
+    def assign(worker):
+        """
+        Send a batch of tasks, retries first, to a ready worker; False if none is queued
+        """
+        nonlocal task_index
+        batch = []
+        while len(batch) < batch_size and (retry_queue or task_index < tasks):
+            if retry_queue:
+                batch.append(retry_queue.popleft())
+            else:
+                batch.append(task_index)
+                task_index += 1
+        if not batch:
+            return False
+        outstanding.setdefault(worker, set()).update(batch)
+        # The send is non-blocking, as a worker prefetching its next batch is still busy with the current one
+        # Tasks travel with their index, which DONE and FAILED report back: a file may be listed twice
+        pending_sends.append(MPI_COMM.isend([(k, job_args[k]) for k in batch], dest=worker, tag=TagStatus.START))
+        LOG.debug("MPI Master (%d) assigning %d task(s) to worker (%d): Process %r file(s)" %
+                  (MPI_JOB_RANK, len(batch), worker, [job_args[k][1] for k in batch]))
+        return True
+
+    def dispatch_held():
+        """
+        Hand the queued tasks to the held workers, in the order they asked, and tell them all
+        to exit once no task is queued or outstanding
+        """
+        while idle_workers and assign(idle_workers[0]):
+            idle_workers.pop(0)
+        if idle_workers and not any(outstanding.values()):
+            for worker in idle_workers:
+                pending_sends.append(MPI_COMM.isend(None, dest=worker, tag=TagStatus.EXIT))
+            idle_workers.clear()
+
+    while closed_workers < num_workers:
+        if monitor is not None:
+            monitor.update(tasks - task_index + len(retry_queue))
+        # Poll rather than block in recv when hung workers are watched for, or when the metrics are
+        # refreshed on a timer, which matters most in the tail where messages are few
+        if (task_timeout or monitor is not None) and not MPI_COMM.Iprobe(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG):
+            now = time.time()
+            for worker, worker_tasks in outstanding.items():
+                if not task_timeout:
+                    break
+                if worker_tasks and now - last_seen[worker] > task_timeout * len(worker_tasks) + TIMEOUT_GRACE:
+                    LOG.error(f"MPI Worker ({worker}) did not report for {now - last_seen[worker]:.0f}s, "
+                              "considering it hung")
+                    for k in worker_tasks:
+                        fail_task(k, 'worker timed out')
+                    worker_tasks.clear()
+                    lost_workers.add(worker)
+                    closed_workers += 1
+                    if worker in idle_workers:
+                        idle_workers.remove(worker)
+            dispatch_held()
+            time.sleep(0.001)
+            continue
+
+        result = MPI_COMM.recv(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=MPI_JOB_STATUS)
+        received = time.perf_counter()
+        source = MPI_JOB_STATUS.Get_source()
+        tag = MPI_JOB_STATUS.Get_tag()
+        last_seen[source] = time.time()
+        worker_tasks = outstanding.setdefault(source, set())
+
+        if tag == TagStatus.READY:
+            # Worker is ready, so assign it a batch of tasks, or hold it until one is re-queued or all are done
+            if source in lost_workers:
+                pending_sends.append(MPI_COMM.isend(None, dest=source, tag=TagStatus.EXIT))
+            else:
+                idle_workers.append(source)
+            dispatch_held()
+            dispatch_latency.append(time.perf_counter() - received)
+            pending_sends[:] = [req for req in pending_sends if not req.test()[0]]
+        elif tag == TagStatus.DONE:
+            durations.update((job_args[k][1], duration) for k, duration in result['durations'].items())
+            worker_tasks.difference_update(result['durations'])
+            if monitor is not None:
+                monitor.task_done(source, result['node'], len(result['durations']),
+                                  sum(result['durations'].values()), result['bytes_in'], result['bytes_out'])
+            LOG.debug(f"MPI Worker ({source}) on {name} completed the assigned task(s)")
+        elif tag == TagStatus.FAILED:
+            k, error = result
+            worker_tasks.discard(k)
+            fail_task(k, error)
+            if monitor is not None:
+                monitor.task_failed(source)
+        elif tag == TagStatus.EXIT:
+            LOG.debug(f"MPI Worker ({source}) exited")
+            if source not in lost_workers:
+                closed_workers += 1
+        if tag in (TagStatus.DONE, TagStatus.FAILED):
+            dispatch_held()
+
+    # Tasks still queued when no worker is left (all hung) are reported rather than lost
+    for k in list(retry_queue) + list(range(task_index, tasks)):
+        failed.setdefault(job_args[k][1], 'no worker left')
+    retry_queue.clear()
+    if monitor is not None:
+        monitor.update(0, force=True)
+    _write_failed_list(failed, failed_list)
+    if lost_workers:
+        # A hung worker would never reach MPI finalisation, so take the job down
+        LOG.error(f"MPI Master ({MPI_JOB_RANK}) aborting, worker(s) {sorted(lost_workers)} are hung")
+        MPI_COMM.Abort(1)
+
+    MPI.Request.waitall(pending_sends)
+    if dispatch_latency:
+        LOG.info("MPI Master (%d) dispatch latency over %d messages: mean %.3f ms, max %.3f ms" %
+                 (MPI_JOB_RANK, len(dispatch_latency),
+                  1000 * sum(dispatch_latency) / len(dispatch_latency), 1000 * max(dispatch_latency)))
+    _report_makespan(job_args, costs, durations, num_workers, time.time() - start_time, schedule_report)
+    LOG.debug("Batch processing completed")
+
+
+def _write_failed_list(failed, failed_list):
+    """
+    Write the files which could not be converted, one per line, so they can be resubmitted
+    """
+    if not failed:
+        return
+    LOG.error(f"{len(failed)} file(s) failed, listed in {failed_list}")
+    if failed_list:
+        with open(failed_list, 'w') as fp:
+            for filename in sorted(failed):
+                fp.write(filename + '\n')
+
+
+def _report_makespan(job_args, costs, durations, num_workers, makespan, schedule_report=None):
+    """
+    Log the makespan predicted from the task costs against the actual one
+
+    Costs are converted to seconds with the mean throughput measured over the run.
+    """
+    done_cost = sum(cost for task, cost in zip(job_args, costs) if task[1] in durations)
+    seconds_per_cost = sum(durations.values()) / done_cost if done_cost else 0.0
+    predicted = predict_makespan(costs, num_workers) * seconds_per_cost
+    LOG.info("MPI Master (%d) makespan over %d file(s): predicted %.1fs, actual %.1fs" %
+             (MPI_JOB_RANK, len(job_args), predicted, makespan))
+
+    if schedule_report:
+        report = {'num_workers': num_workers,
+                  'predicted_makespan': predicted,
+                  'actual_makespan': makespan,
+                  'seconds_per_cost': seconds_per_cost,
+                  'tasks': [{'filename': task[1], 'cost': cost, 'duration': durations.get(task[1])}
+                            for task, cost in zip(job_args, costs)]}
+        with open(schedule_report, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+
+def _mpi_worker(prefetch, task_timeout=None):
+    """
+    Process the batches of tasks sent by the master until it sends EXIT
+
+    With 'prefetch', the next batch is requested as soon as a batch is received,
+    so that it is already queued when the current one is done. Failed tasks are
+    reported with FAILED, the others with one DONE per batch, by their index in the task list.
+    """
+    proc_name = MPI.Get_processor_name()
+    processed = 0
+    waited = 0.0
+
+    MPI_COMM.send(None, dest=0, tag=TagStatus.READY)
+    while True:
+        start = time.perf_counter()
+        batch = MPI_COMM.recv(source=0, tag=MPI.ANY_TAG, status=MPI_JOB_STATUS)
+        waited += time.perf_counter() - start
+        if MPI_JOB_STATUS.Get_tag() != TagStatus.START:
+            break
+
+        if prefetch:
             MPI_COMM.send(None, dest=0, tag=TagStatus.READY)
-            task = MPI_COMM.recv(source=0, tag=MPI.ANY_TAG, status=MPI_JOB_STATUS)
-            tag = MPI_JOB_STATUS.Get_tag()
-
-            if tag == TagStatus.START:
-                LOG.debug(f"MPI Worker ({MPI_JOB_RANK}) on {proc_name} started COG conversion")
-                netcdf_cog_worker(wargs=task)
-                MPI_COMM.send(None, dest=0, tag=TagStatus.DONE)
-            elif tag == TagStatus.EXIT:
+        LOG.debug(f"MPI Worker ({MPI_JOB_RANK}) on {proc_name} started COG conversion of {len(batch)} file(s)")
+        # Timings and byte counts ride on DONE for the master's telemetry
+        done = {'node': proc_name, 'durations': {}, 'bytes_in': 0, 'bytes_out': 0}
+        for k, task in batch:
+            duration, error, bytes_written = run_task(task, task_timeout)
+            if error is None:
+                done['durations'][k] = duration
+                done['bytes_in'] += os.path.getsize(task[1])
+                done['bytes_out'] += bytes_written
+            else:
+                MPI_COMM.send((k, error), dest=0, tag=TagStatus.FAILED)
+        processed += len(batch)
+        MPI_COMM.send(done, dest=0, tag=TagStatus.DONE)
+        if not prefetch:
+            MPI_COMM.send(None, dest=0, tag=TagStatus.READY)
+
+    LOG.debug(f"MPI Worker ({MPI_JOB_RANK}) processed {processed} file(s), waited {waited:.2f}s for tasks, "
+              "hence sending exit status to the master")
+    MPI_COMM.send(None, dest=0, tag=TagStatus.EXIT)
+
+
+def _init_pool_worker(task_timeout, metrics_file=None, profile_dir=None, profile_slowest=10):
+    """
+    Set up a process of the local pool: one GDAL thread and a bounded block cache each
+    """
+    timing.configure(metrics_file, profile_dir, profile_slowest)
+    os.environ['GDAL_NUM_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = '1'
+    os.environ.setdefault('GDAL_CACHEMAX', str(POOL_GDAL_CACHEMAX))
+    global POOL_TASK_TIMEOUT
+    POOL_TASK_TIMEOUT = task_timeout
+
+
+def _run_pool_task(task):
+    return run_task(task, POOL_TASK_TIMEOUT)
+
+
+@cli.command(name='convert-cog')
+@click.option('--config', '-c', help='Config file')
+@click.option('--output-dir', help='Output directory', required=True)
+@click.option('--product', help='Product name', required=True)
+@click.option('--workers', type=int, default=os.cpu_count(), show_default=True,
+              help='Number of conversion processes')
+@click.option('--band-workers', type=int, help='Number of bands of a file encoded concurrently')
+@click.option('--band-memory-limit', type=int, help='Memory cap (MiB) for the bands of a file encoded concurrently')
+@click.option('--scratch-dir', envvar='PBS_JOBFS', type=click.Path(exists=True, file_okay=False),
+              help='Local scratch directory for rasters too large to stage in memory (default: $PBS_JOBFS)')
+@click.option('--schedule', type=click.Choice(['fifo', 'lpt']), default='fifo', show_default=True,
+              help='Convert files in file-list order, or largest estimated cost first')
+@click.option('--probe-headers', is_flag=True,
+              help='Estimate costs from the NetCDF headers (subdatasets and raster size) instead of file sizes')
+@click.option('--max-retries', type=int, default=2, show_default=True,
+              help='Number of times a failed file is retried')
+@click.option('--task-timeout', type=float, help='Time limit (seconds) for converting one file')
+@click.option('--failed-list', type=click.Path(dir_okay=False, writable=True),
+              help='Write the files which could not be converted to this file (default: OUTPUT_DIR/failed_files)')
+@click.option('--metrics-file', type=click.Path(dir_okay=False, writable=True),
+              help='Append per-stage timing records (JSON Lines) to this file')
+@click.option('--profile-dir', type=click.Path(file_okay=False, writable=True),
+              help='Profile each file with cProfile and keep the profiles of the slowest ones in this directory')
+@click.option('--profile-slowest', type=int, default=10, show_default=True,
+              help='Number of profiles kept by each process with --profile-dir')
+@click.option('--s3-bucket', help='Upload the COGs and YAMLs to this S3 bucket instead of writing them under '
+                                   'the output directory (which keeps the completion ledgers)')
+@click.option('--s3-endpoint-url', help='Endpoint of an S3-compatible object store (e.g. MinIO)')
+@click.option('--aws-product', help='Product of aws_products_config.yaml giving the key prefix (default: --product)')
+@click.argument('filelist', nargs=1, required=True)
+def convert_cog(config, output_dir, product, workers, band_workers, band_memory_limit, scratch_dir, schedule,
+                probe_headers, max_retries, task_timeout, failed_list, metrics_file, profile_dir, profile_slowest,
+                s3_bucket, s3_endpoint_url, aws_product, filelist):
+    """
+    Parallelise COG convert over a local process pool, without MPI
+    Iterate over filename and output dir as job argument
+    """
+    file_list = _read_file_list(filelist)
+    product_config = _product_config(config, product, band_workers, band_memory_limit, scratch_dir,
+                                     s3_bucket, s3_endpoint_url, aws_product)
+    if workers is None or workers < 1:
+        _raise_value_err("Number of workers must be at least one")
+    if failed_list is None:
+        failed_list = pjoin(output_dir, 'failed_files')
+
+    failed = {}
+    with multiprocessing.Pool(processes=workers, initializer=_init_pool_worker,
+                              initargs=(task_timeout, metrics_file, profile_dir, profile_slowest)) as pool:
+        # The headers are probed by the pool too
+        job_args, _ = _plan_tasks(file_list, product_config, output_dir, schedule, probe_headers, pool.map)
+        for attempt in range(max_retries + 1):
+            # Files are handed out one at a time, in the planned order
+            results = pool.imap(_run_pool_task, job_args, chunksize=1)
+            retry = []
+            for task, (duration, error, _) in zip(job_args, results):
+                if error is None:
+                    LOG.debug(f"Converted {task[1]} in {duration:.1f}s")
+                    failed.pop(task[1], None)
+                else:
+                    failed[task[1]] = error
+                    retry.append(task)
+            job_args = retry
+            if not job_args:
                 break
+            if attempt < max_retries:
+                LOG.warning(f"Retrying {len(job_args)} failed file(s)")
+
+    _write_failed_list(failed, failed_list)
+    LOG.debug("Batch processing completed")
+
+
+def _scan_tree(path):
+    """
+    Return the (path, size) of the NetCDF files under 'path'
+    """
+    found = []
+    try:
+        entries = list(os.scandir(path))
+    except OSError as e:
+        LOG.warning(f"Cannot scan {path}: {e}")
+        return found
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            found.extend(_scan_tree(entry.path))
+        elif entry.name.endswith('.nc'):
+            found.append((entry.path, entry.stat().st_size))
+    return found
+
+
+def scan_netcdf_files(src_dir, workers=16):
+    """
+    Return the (path, size) of the NetCDF files under 'src_dir', scanning its subdirectories in parallel
+    """
+    found = []
+    subdirs = []
+    for entry in os.scandir(src_dir):
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.path)
+        elif entry.name.endswith('.nc'):
+            found.append((entry.path, entry.stat().st_size))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for subdir_files in executor.map(_scan_tree, subdirs):
+            found.extend(subdir_files)
+    return found
+
+
+@cli.command(name='plan-jobs')
+@click.option('--nc-path', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Directory to search for NetCDF files')
+@click.option('--output-dir', required=True, type=click.Path(exists=True, file_okay=False),
+              help='Directory for the file lists, the submit script and the COGs')
+@click.option('--config', '-c', required=True, help='Config file')
+@click.option('--product', required=True, help='Product name')
+@click.option('--ncpus', type=int, default=80, show_default=True, help='Number of CPUs of each PBS job')
+@click.option('--walltime', default='1:00:00', show_default=True, help='Walltime (H:MM:SS) of each PBS job')
+@click.option('--throughput', type=float, default=4 * 1024 ** 3, show_default=True,
+              help='Cost converted per CPU-hour: bytes, or pixels with --probe-headers '
+                   '(3600 / seconds_per_cost of a --schedule-report)')
+@click.option('--fill', type=float, default=0.8, show_default=True,
+              help='Fraction of the walltime each job is planned to use')
+@click.option('--probe-headers', is_flag=True,
+              help='Estimate costs from the NetCDF headers (subdatasets and raster size) instead of file sizes')
+@click.option('--scan-workers', type=int, default=16, show_default=True,
+              help='Number of directories scanned in parallel')
+@click.option('--project', required=True, help='PBS project')
+@click.option('--queue', default='normal', show_default=True, help='PBS queue')
+@click.option('--mem', help='PBS memory request (default: 31GB per 16 CPUs)')
+@click.option('--jobfs', default='32GB', show_default=True, help='PBS jobfs request')
+def plan_jobs(nc_path, output_dir, config, product, ncpus, walltime, throughput, fill, probe_headers,
+              scan_workers, project, queue, mem, jobfs):
+    """
+    Split the NetCDF files of a directory into PBS jobs of balanced cost
+    Writes the file lists and a script submitting them as a chain of dependent jobs
+    """
+    files = scan_netcdf_files(nc_path, scan_workers)
+    empty = sorted(path for path, size in files if size == 0)
+    files = sorted((path, size) for path, size in files if size > 0)
+    costs = [estimate_task_cost(path, probe_headers) if probe_headers else size for path, size in files]
+
+    capacity = job_capacity(throughput, ncpus, walltime, fill)
+    chunks = pack_chunks(costs, capacity) if files else []
+
+    output_dir = os.path.abspath(output_dir)
+    with open(pjoin(output_dir, 'file_empty_list'), 'w') as fp:
+        for path in empty:
+            fp.write(path + '\n')
+
+    file_lists = []
+    for j, chunk in enumerate(chunks, start=1):
+        file_lists.append(pjoin(output_dir, f'file_list_{j}'))
+        with open(file_lists[-1], 'w') as fp:
+            for k in chunk:
+                fp.write(files[k][0] + '\n')
+        LOG.info(f"Job {j}: {len(chunk)} file(s), estimated cost {sum(costs[k] for k in chunk)}")
+
+    if mem is None:
+        mem = f'{-(-ncpus // 16) * 31}GB'
+    qsub = (f'qsub -V -P {project} -q {queue} -l walltime={walltime},mem={mem},jobfs={jobfs},ncpus={ncpus},wd')
+    convert = (f'-- mpirun --oversubscribe -n {ncpus} python3 "{os.path.abspath(__file__)}" mpi-convert-cog '
+               f'-c "{os.path.abspath(config)}" --output-dir "{output_dir}" --product {product} '
+               f'--numprocs {ncpus - 1}')
+    script = pjoin(output_dir, 'submit_jobs.sh')
+    with open(script, 'w') as fp:
+        fp.write('#!/bin/bash\nset -eu\n\n')
+        fp.write(f'cd "{output_dir}"\n')
+        for j, file_list in enumerate(file_lists):
+            depend = '-W depend=afterany:"$f_j" ' if j > 0 else ''
+            fp.write(f'f_j=$({qsub} {depend}{convert} "{file_list}")\n')
+    os.chmod(script, 0o755)
+
+    LOG.info(f"Planned {len(files)} file(s) in {len(file_lists)} job(s), {len(empty)} empty file(s) skipped; "
+             f"submit them with {script}")
+
+
+@cli.command(name='autotune')
+@click.option('--config', '-c', help='Config file')
+@click.option('--product', help='Product name', required=True)
+@click.option('--files', type=int, default=5, show_default=True,
+              help='Number of files of the file list sampled at random')
+@click.option('--samples', type=int, default=8, show_default=True,
+              help='Number of 512x512 blocks sampled from each variable of a file')
+@click.option('--candidates', default='DEFLATE:6,DEFLATE:9,ZSTD:9,ZSTD:15,LZW,LERC_ZSTD:9', show_default=True,
+              help='Comma separated codecs to compare, as CODEC[:LEVEL] (the level of LERC is its maximum error)')
+@click.option('--seed', type=int, default=0, show_default=True, help='Seed of the sampling')
+@click.option('--output', '-o', type=click.File('w'), help='Write the full report to this JSON file')
+@click.argument('filelist', nargs=1, required=True)
+def autotune_codecs(config, product, files, samples, candidates, seed, output, filelist):
+    """
+    Compare compression codecs on blocks sampled from the files of a product
+    Each candidate, and the codec currently configured for each band, is timed
+    encoding and decoding the same blocks
+    """
+    file_list = np.atleast_1d(_read_file_list(filelist))
+    product_config = _product_config(config, product)
+    cog_netcdf = COGNetCDF(**product_config)
+    rng = np.random.default_rng(seed)
+    paths = rng.choice(file_list, size=min(files, file_list.size), replace=False)
+
+    white_list = '|'.join(product_config.get('white_list') or []) or None
+    black_list = '|'.join(product_config.get('black_list') or []) or None
 
-        LOG.debug(f"MPI Worker ({MPI_JOB_RANK}) did not receive any task, hence sending exit status to the master")
-        MPI_COMM.send(None, dest=0, tag=TagStatus.EXIT)
+    def band_filter(band_name):
+        if black_list is not None and re.search(black_list, band_name) is not None:
+            return False
+        return white_list is None or re.search(white_list, band_name) is not None
+
+    codecs = {text: parse_candidate(text) for text in candidates.split(',')}
+    report = {}
+    # The predictor of the product applies to every candidate, and each band is also
+    # measured with its current settings
+    for band_name in _band_names(paths[0], band_filter):
+        current = {key: value for key, value in cog_netcdf._band_profile(band_name).items()
+                   if key not in ('driver', 'interleave', 'tiled', 'blockxsize', 'blockysize')}
+        band_codecs = {name: compression_options(predictor=cog_netcdf.predictor, **codec)
+                       for name, codec in codecs.items()}
+        band_codecs['current'] = current
+        report.update(autotune(paths, band_codecs, samples, lambda name, band=band_name: name == band, seed))
+
+    for band_name, results in sorted(report.items()):
+        LOG.info(f"{band_name}:")
+        LOG.info(f"    {'codec':<16} {'ratio':>7} {'encode MB/s':>12} {'decode MB/s':>12} {'max error':>10}")
+        for name, totals in sorted(results.items(), key=lambda item: -item[1]['ratio']):
+            LOG.info(f"    {name:<16} {totals['ratio']:7.2f} {totals['encode_mb_per_sec']:12.1f} "
+                     f"{totals['decode_mb_per_sec']:12.1f} {totals['max_error']:10g}")
+
+    if output is not None:
+        json.dump({'files': [str(path) for path in paths], 'samples': samples, 'bands': report}, output, indent=2)
+
+
+def _band_names(path, band_filter):
+    with rasterio.open(path) as ds:
+        return [subdataset.split(':')[-1] for subdataset in ds.subdatasets[:-1]
+                if band_filter(subdataset.split(':')[-1])]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,158 @@
+"""
+Live throughput telemetry of an MPI conversion job.
+
+The MPI master feeds the per-task timings and byte counts that workers send
+with their DONE messages to a `ThroughputMonitor`, which periodically rewrites
+a JSON snapshot and a Prometheus textfile (for the node exporter's textfile
+collector) with cluster, per-node and per-rank throughput, the queue depth
+and an ETA.
+"""
+import json
+import os
+import statistics
+import time
+from os.path import join as pjoin
+
+from fileio import write_replacing
+
+JSON_NAME = 'cog_metrics.json'
+PROMETHEUS_NAME = 'cog_metrics.prom'
+
+# Ranks converting slower than this fraction of the median rank are flagged as stragglers
+STRAGGLER_RATIO = 0.5
+
+
+class _Counters:
+    """
+    Throughput counters of a rank or a node
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.busy = 0.0
+        self.last_seen = None
+
+    def add(self, files, busy, bytes_in, bytes_out):
+        self.files += files
+        self.busy += busy
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.last_seen = time.time()
+
+    def as_dict(self, elapsed):
+        return {'files': self.files,
+                'failed': self.failed,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'busy_seconds': self.busy,
+                'files_per_sec': self.files / elapsed if elapsed > 0 else 0.0,
+                'bytes_per_sec': self.bytes_in / elapsed if elapsed > 0 else 0.0,
+                'last_seen': self.last_seen}
+
+
+class ThroughputMonitor:
+    """
+    Aggregate the progress reported by the workers and publish it every 'interval' seconds
+    """
+
+    def __init__(self, metrics_dir, total_files, total_bytes, interval=30):
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.metrics_dir = metrics_dir
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.start = time.time()
+        self.last_write = 0.0
+        self.total = _Counters()
+        self.ranks = {}
+        self.nodes = {}
+        self.rank_nodes = {}
+
+    def _counters(self, rank, node):
+        if node is not None:
+            self.rank_nodes[rank] = node
+        node = self.rank_nodes.get(rank, 'unknown')
+        return self.ranks.setdefault(rank, _Counters()), self.nodes.setdefault(node, _Counters())
+
+    def task_done(self, rank, node, files, busy, bytes_in, bytes_out):
+        for counters in (self.total, *self._counters(rank, node)):
+            counters.add(files, busy, bytes_in, bytes_out)
+
+    def task_failed(self, rank, node=None):
+        for counters in (self.total, *self._counters(rank, node)):
+            counters.failed += 1
+
+    def snapshot(self, queue_depth):
+        elapsed = time.time() - self.start
+        total = self.total.as_dict(elapsed)
+        remaining_bytes = max(0, self.total_bytes - self.total.bytes_in)
+        if total['bytes_per_sec'] > 0:
+            eta = remaining_bytes / total['bytes_per_sec']
+        elif total['files_per_sec'] > 0:
+            eta = (self.total_files - self.total.files) / total['files_per_sec']
+        else:
+            eta = None
+
+        ranks = {rank: counters.as_dict(elapsed) for rank, counters in self.ranks.items()}
+        rates = [rank['bytes_per_sec'] for rank in ranks.values()]
+        median_rate = statistics.median(rates) if rates else 0.0
+        for rank, counters in ranks.items():
+            counters['node'] = self.rank_nodes.get(rank, 'unknown')
+            counters['straggler'] = counters['bytes_per_sec'] < STRAGGLER_RATIO * median_rate
+
+        return {'time': time.time(),
+                'elapsed_seconds': elapsed,
+                'files_total': self.total_files,
+                'bytes_total': self.total_bytes,
+                'queue_depth': queue_depth,
+                'eta_seconds': eta,
+                'cluster': total,
+                'nodes': {node: counters.as_dict(elapsed) for node, counters in self.nodes.items()},
+                'ranks': ranks}
+
+    def update(self, queue_depth, force=False):
+        """
+        Rewrite the metrics files if 'interval' has passed since the last time (or if 'force')
+        """
+        if not force and time.time() - self.last_write < self.interval:
+            return
+        self.last_write = time.time()
+        snapshot = self.snapshot(queue_depth)
+        write_replacing(pjoin(self.metrics_dir, JSON_NAME), json.dumps(snapshot, indent=2))
+        write_replacing(pjoin(self.metrics_dir, PROMETHEUS_NAME), self._prometheus(snapshot))
+
+    @staticmethod
+    def _prometheus(snapshot):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP cog_{name} {help_text}')
+            lines.append(f'# TYPE cog_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f'cog_{name}{{{label_text}}} {value}' if label_text else f'cog_{name} {value}')
+
+        cluster = snapshot['cluster']
+        metric('files_total', 'gauge', 'Files to convert', [({}, snapshot['files_total'])])
+        metric('queue_depth', 'gauge', 'Files not yet assigned to a worker', [({}, snapshot['queue_depth'])])
+        metric('eta_seconds', 'gauge', 'Estimated time to completion',
+               [({}, snapshot['eta_seconds'] if snapshot['eta_seconds'] is not None else 'NaN')])
+        for key, name, kind, help_text in (('files', 'files_done_total', 'counter', 'Files converted'),
+                                           ('failed', 'files_failed_total', 'counter', 'File conversions failed'),
+                                           ('bytes_in', 'bytes_read_total', 'counter', 'NetCDF bytes converted'),
+                                           ('bytes_out', 'bytes_written_total', 'counter', 'COG bytes written'),
+                                           ('files_per_sec', 'files_per_second', 'gauge', 'File throughput'),
+                                           ('bytes_per_sec', 'bytes_per_second', 'gauge', 'NetCDF byte throughput')):
+            samples = [({'scope': 'cluster'}, cluster[key])]
+            samples += [({'scope': 'node', 'node': node}, counters[key])
+                        for node, counters in snapshot['nodes'].items()]
+            samples += [({'scope': 'rank', 'node': counters['node'], 'rank': rank}, counters[key])
+                        for rank, counters in snapshot['ranks'].items()]
+            metric(name, kind, help_text, samples)
+        metric('rank_straggler', 'gauge', 'Rank converting much slower than the median rank',
+               [({'node': counters['node'], 'rank': rank}, int(counters['straggler']))
+                for rank, counters in snapshot['ranks'].items()])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,122 @@
+"""
+Optional per-stage instrumentation of the conversion.
+
+Code wraps its stages in `stage(name, **fields)`. Once `configure` has been
+given a metrics file, each stage appends one JSON record to it with its wall
+and CPU time, the bytes read and written by the process, and the peak RSS of
+the process so far (not of the stage). Counters are process-wide, so stages running in concurrent threads include
+each other's CPU time and I/O. Otherwise `stage` does nothing.
+
+With a profile directory, whole files are run under cProfile and the
+profiles of the slowest ones of each process are kept.
+"""
+import cProfile
+import heapq
+import os
+import resource
+import time
+from contextlib import contextmanager
+from os.path import join as pjoin, basename
+
+from fileio import append_record
+
+_METRICS_FILE = None
+_PROFILE_DIR = None
+_PROFILE_SLOWEST = 0
+_PROFILES = []          # Heap of the (wall time, profile path) kept by this process
+_CURRENT_FILE = None    # Input file being converted, added to every record
+
+
+def configure(metrics_file=None, profile_dir=None, profile_slowest=10):
+    """
+    Enable the stage records and/or the profiles of the slowest files
+    """
+    global _METRICS_FILE, _PROFILE_DIR, _PROFILE_SLOWEST
+    _METRICS_FILE = metrics_file
+    _PROFILE_DIR = profile_dir
+    _PROFILE_SLOWEST = profile_slowest if profile_dir else 0
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def _io_counters():
+    """
+    Bytes read and written by this process so far, or (None, None) where /proc is not available
+    """
+    counters = {}
+    try:
+        with open('/proc/self/io') as fd:
+            for line in fd:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except OSError:
+        return None, None
+    return counters.get('rchar'), counters.get('wchar')
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a stage of the conversion
+
+    Yields the record being built, so that callers can add fields to it.
+    """
+    if _METRICS_FILE is None:
+        yield {}
+        return
+
+    record = {'stage': name, 'file': _CURRENT_FILE, 'pid': os.getpid()}
+    record.update(fields)
+    read0, written0 = _io_counters()
+    wall0 = time.perf_counter()
+    cpu0 = time.process_time()
+    try:
+        yield record
+    finally:
+        read1, written1 = _io_counters()
+        record['wall'] = time.perf_counter() - wall0
+        record['cpu'] = time.process_time() - cpu0
+        record['read_bytes'] = read1 - read0 if read0 is not None else None
+        record['written_bytes'] = written1 - written0 if written0 is not None else None
+        # The high-water mark of the whole process so far, not of the stage (kilobytes on Linux)
+        record['process_peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        append_record(_METRICS_FILE, record)
+
+
+def _keep_profile(profile, input_file, wall):
+    """
+    Dump the profile of a file if it is among the slowest of this process
+    """
+    if len(_PROFILES) >= _PROFILE_SLOWEST and wall <= _PROFILES[0][0]:
+        return
+    path = pjoin(_PROFILE_DIR, '{}.{}.prof'.format(basename(input_file), os.getpid()))
+    profile.dump_stats(path)
+    heapq.heappush(_PROFILES, (wall, path))
+    if len(_PROFILES) > _PROFILE_SLOWEST:
+        _, evicted = heapq.heappop(_PROFILES)
+        if evicted != path:
+            os.remove(evicted)
+
+
+@contextmanager
+def file_stage(input_file):
+    """
+    Time (and optionally profile) the whole conversion of an input file
+    """
+    global _CURRENT_FILE
+    _CURRENT_FILE = input_file
+    profile = cProfile.Profile() if _PROFILE_SLOWEST > 0 else None
+    start = time.perf_counter()
+    try:
+        with stage('file', size=os.path.getsize(input_file) if _METRICS_FILE else None):
+            if profile is not None:
+                profile.enable()
+            try:
+                yield
+            finally:
+                if profile is not None:
+                    profile.disable()
+    finally:
+        _CURRENT_FILE = None
+        if profile is not None:
+            _keep_profile(profile, input_file, time.perf_counter() - start)
@@ -0,0 +1,123 @@
+"""
+Per-product watermark of the datasets already listed for conversion.
+
+The watermark records the latest time a dataset or location of the product
+was added to the index among those seen by the previous run, and the path of
+that list. A run "since the last run" then asks the index only for the
+datasets added or relocated after the watermark.
+
+Index rows get their 'added' time when their transaction starts, so a row
+committed just after a run may carry an earlier time than the watermark. The
+next run therefore looks back LAG before the watermark, and skips the files it
+already saw in that window, which the watermark keeps.
+
+A run restricted to a year, a month or a start date only sees the datasets in
+that time range, so its watermark says nothing of the rest of the product: it
+is kept apart from the watermark of the whole product (see `scope_name`).
+"""
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+try:
+    from fileio import write_replacing
+except ImportError:
+    # Imported as streamer.watermark by work_list.py
+    from streamer.fileio import write_replacing
+
+DEFAULT_DIR = Path.home() / '.cache' / 'cog-conversion' / 'watermarks'
+
+# How far back before the watermark a run looks for late commits
+LAG = timedelta(hours=1)
+
+# Watermark of a product never listed
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Number of files kept in the look-back window before old ones are dropped
+PRUNE_SIZE = 100000
+
+
+def scope_name(year=None, month=None, from_date=None):
+    """
+    Name of the part of a product listed with the given time filter, None for the whole product
+
+    The filters take the same precedence as in the index queries: the start date, then the year and month.
+    """
+    if from_date:
+        return f'from-{from_date:%Y-%m-%d}'
+    if year and month:
+        return f'{year}-{month:02d}'
+    if year:
+        return str(year)
+    return None
+
+
+class Watermark:
+    """
+    Watermark of a product, or of the part of it named by 'scope', stored as JSON under 'directory'
+    """
+
+    def __init__(self, product, directory=DEFAULT_DIR, scope=None):
+        self.product = product
+        self.scope = scope
+        self.path = Path(directory) / (f'{product}.json' if scope is None else f'{product}.{scope}.json')
+        self.indexed_until = None
+        self.recent = {}
+        self.last_list = None
+        self._previous = {}
+        self._prune_at = PRUNE_SIZE
+        try:
+            with open(self.path) as fd:
+                state = json.load(fd)
+        except FileNotFoundError:
+            return
+        self.indexed_until = datetime.fromisoformat(state['indexed_until'])
+        self.recent = {uri: datetime.fromisoformat(added) for uri, added in state['recent'].items()}
+        self.last_list = state['last_list']
+        self._previous = dict(self.recent)
+
+    @property
+    def since(self):
+        """
+        Time from which to query the index
+        """
+        if self.indexed_until is None:
+            return EPOCH
+        return self.indexed_until - LAG
+
+    def is_new(self, uri, added):
+        """
+        False if 'uri' was already seen by the previous run in the look-back window, with the same 'added' time
+        """
+        previous = self._previous.get(uri)
+        return previous is None or added > previous
+
+    def observe(self, uri, added):
+        """
+        Move the watermark past a dataset added to the index at 'added'
+        """
+        if self.indexed_until is None or added > self.indexed_until:
+            self.indexed_until = added
+        if added > self.since:
+            self.recent[uri] = max(added, self.recent.get(uri, added))
+            if len(self.recent) > self._prune_at:
+                horizon = self.since
+                self.recent = {uri: added for uri, added in self.recent.items() if added > horizon}
+                self._prune_at = max(PRUNE_SIZE, 2 * len(self.recent))
+
+    def save(self, last_list):
+        """
+        Record the watermark once 'last_list' is completely written
+        """
+        if self.indexed_until is None:
+            # Nothing in the product yet
+            return
+        horizon = self.since
+        state = {'product': self.product,
+                 'scope': self.scope,
+                 'indexed_until': self.indexed_until.isoformat(),
+                 'recent': {uri: added.isoformat() for uri, added in self.recent.items() if added > horizon},
+                 'last_list': str(last_list),
+                 'saved': datetime.now().isoformat()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_replacing(self.path, json.dumps(state, indent=1))
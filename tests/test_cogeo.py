@@ -0,0 +1,205 @@
+"""
+Tests of the block sweep of cogeo.cog_translate_many on small GeoTIFF sources
+"""
+import os
+import sys
+from os.path import join as pjoin
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+rasterio = pytest.importorskip('rasterio')
+from rasterio.transform import from_origin  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [pjoin(REPO_DIR, 'streamer'), REPO_DIR]
+
+import cogeo  # noqa: E402
+
+CONFIG = {'NUM_THREADS': 1, 'GDAL_TIFF_OVR_BLOCKSIZE': 512}
+DST_KWARGS = {'driver': 'GTiff', 'interleave': 'pixel', 'tiled': True, 'blockxsize': 512, 'blockysize': 512,
+              'compress': 'deflate', 'predictor': 2}
+
+
+def make_source(path, count=3, width=1100, height=900, blockysize=256, dtype='int16', nodata=-999):
+    """
+    Write a tiled GeoTIFF of random pixels, and return them
+    """
+    rng = numpy.random.default_rng(0)
+    data = rng.integers(0, 3000, (count, height, width)).astype(dtype)
+    data[:, :10, :10] = nodata
+    profile = {'driver': 'GTiff', 'width': width, 'height': height, 'count': count, 'dtype': dtype,
+               'nodata': nodata, 'tiled': True, 'blockxsize': 256, 'blockysize': blockysize,
+               'transform': from_origin(1500000, -3900000, 25, 25), 'crs': 'EPSG:3577'}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data)
+    return data
+
+
+def translate(tmp_path, src, tag, count=3, **kwargs):
+    bands = [{'src': src, 'indexes': [i], 'dst_path': str(tmp_path / f'{tag}_{i}.tif'),
+              'dst_kwargs': DST_KWARGS, 'overview_resampling': 'average'} for i in range(1, count + 1)]
+    cogeo.cog_translate_many(bands, config=CONFIG, **kwargs)
+    return [band['dst_path'] for band in bands]
+
+
+def test_concurrent_outputs_identical(tmp_path):
+    src = str(tmp_path / 'src.tif')
+    make_source(src)
+
+    serial = translate(tmp_path, src, 'serial', max_workers=1)
+    threaded = translate(tmp_path, src, 'threaded', max_workers=4)
+
+    for serial_path, threaded_path in zip(serial, threaded):
+        with open(serial_path, 'rb') as fd:
+            serial_bytes = fd.read()
+        with open(threaded_path, 'rb') as fd:
+            assert fd.read() == serial_bytes
+    with rasterio.open(threaded[0]) as dst:
+        assert dst.block_shapes == [(512, 512)]
+        assert dst.overviews(1) == [2, 4, 8, 16, 31]
+
+
+@pytest.mark.parametrize('in_memory', [True, False])
+def test_upload(tmp_path, in_memory):
+    src = str(tmp_path / 'src.tif')
+    make_source(src)
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    local = translate(tmp_path, src, 'local')
+    uploaded = {}
+
+    def upload(fileobj, dst_path):
+        # Large rasters are uploaded from a scratch file rather than from memory
+        assert hasattr(fileobj, 'name') and fileobj.name.startswith(str(scratch)) != in_memory
+        fileobj.seek(0)
+        uploaded[dst_path] = fileobj.read()
+
+    translate(tmp_path, src, 'uploaded', in_memory=in_memory, temp_dir=str(scratch), upload=upload)
+
+    for local_path in local:
+        with open(local_path, 'rb') as fd:
+            assert uploaded[local_path.replace('local_', 'uploaded_')] == fd.read()
+    assert not os.path.exists(local[0].replace('local_', 'uploaded_'))
+    assert list(scratch.iterdir()) == []
+
+
+def test_downsample_average_and_nearest():
+    data = numpy.array([[[1, 2, 10, 20],
+                         [3, 5, 30, 40]]], dtype='int16')
+
+    assert cogeo._downsample(data, 'average').tolist() == [[[3, 25]]]
+    assert cogeo._downsample(data, 'nearest').tolist() == [[[1, 10]]]
+    assert cogeo._downsample(data.astype('float32'), 'average').tolist() == [[[2.75, 25.0]]]
+
+
+def test_downsample_nodata():
+    data = numpy.array([[[-999, 4, -999, -999],
+                         [-999, 7, -999, -999]]], dtype='int16')
+
+    assert cogeo._downsample(data, 'average', -999).tolist() == [[[6, -999]]]
+    assert cogeo._downsample(data, 'mode', -999).tolist() == [[[4, -999]]]
+
+    nan = float('nan')
+    floats = numpy.array([[[nan, 1], [3, nan]]], dtype='float32')
+    assert cogeo._downsample(floats, 'average', nan).tolist() == [[[2.0]]]
+    assert numpy.isnan(cogeo._downsample(numpy.full((1, 2, 2), nan, 'float32'), 'average', nan)).all()
+
+
+def test_downsample_mode():
+    # On ties, the first value of the window to reach the highest count
+    data = numpy.array([[[1, 2, 5, 6],
+                         [2, 1, 6, 5]]], dtype='uint8')
+
+    assert cogeo._downsample(data, 'mode').tolist() == [[[2, 6]]]
+
+
+def test_downsample_odd_sizes():
+    data = numpy.arange(15, dtype='int16').reshape((1, 5, 3))
+
+    # The missing pixels of the last row and column are left out
+    assert cogeo._downsample(data, 'average').tolist() == [[[2, 4], [8, 10], [13, 14]]]
+    assert cogeo._downsample(data, 'nearest').tolist() == [[[0, 2], [6, 8], [12, 14]]]
+    assert cogeo._downsample(data, 'mode', 0).tolist() == [[[1, 2], [6, 8], [12, 14]]]
+
+
+@pytest.mark.parametrize('resampling', ['average', 'nearest', 'mode'])
+def test_pyramid_by_blocks(resampling):
+    from rasterio.windows import Window
+
+    rng = numpy.random.default_rng(0)
+    data = rng.integers(0, 4, (2, 37, 29)).astype('int16')
+    meta = {'count': 2, 'height': 37, 'width': 29, 'dtype': 'int16', 'nodata': 0}
+    pyramid = cogeo._Pyramid(meta, resampling, overview_level=2)
+
+    for row in range(0, 37, 8):
+        for col in range(0, 29, 8):
+            window = Window(col, row, min(8, 29 - col), min(8, 37 - row))
+            pyramid.add(data[:, row:row + window.height, col:col + window.width], window)
+
+    expected = data
+    for level in pyramid.levels:
+        expected = cogeo._downsample(expected, resampling, 0)
+        assert level.shape == expected.shape
+        numpy.testing.assert_array_equal(level, expected)
+    assert [level.shape for level in pyramid.levels] == [(2, 19, 15), (2, 10, 8)]
+
+
+@pytest.mark.parametrize('height, blockysize', [(960, 160), (900, 128), (1024, 256)])
+@pytest.mark.parametrize('buffer_limit', [cogeo.STRIP_BUFFER_LIMIT, 0])
+def test_source_reader(tmp_path, height, blockysize, buffer_limit):
+    from rasterio.windows import Window
+
+    path = str(tmp_path / 'src.tif')
+    make_source(path, height=height, blockysize=blockysize)
+
+    with rasterio.open(path) as src:
+        reader = cogeo._SourceReader(src, [1, 3], 512, buffer_limit, 512)
+        assert (reader.chunk_height is not None) == (buffer_limit > 0)
+        for row in range(0, height, 512):
+            for col in range(0, 1100, 512):
+                w = Window(col, row, min(512, 1100 - col), min(512, height - row))
+                numpy.testing.assert_array_equal(reader.read(w), src.read(window=w, indexes=[1, 3]))
+
+
+@pytest.mark.parametrize('height, blockysize', [(960, 160), (900, 128)])
+@pytest.mark.parametrize('stack_reads', [True, False])
+@pytest.mark.parametrize('buffer_limit', [cogeo.STRIP_BUFFER_LIMIT, 0])
+def test_stacked_reads(tmp_path, height, blockysize, stack_reads, buffer_limit):
+    src = str(tmp_path / 'src.tif')
+    data = make_source(src, height=height, blockysize=blockysize)
+
+    outputs = translate(tmp_path, src, 'out', stack_reads=stack_reads, buffer_limit=buffer_limit)
+
+    for band, path in zip(data, outputs):
+        with rasterio.open(path) as dst:
+            numpy.testing.assert_array_equal(dst.read(1), band)
+
+
+PRODUCT_CODEC = {'compress': 'DEFLATE', 'level': 9, 'predictor': 2}
+
+
+@pytest.mark.parametrize('band_codec, options', [
+    # No override: the product codec
+    (None, {'compress': 'DEFLATE', 'zlevel': 9, 'predictor': 2}),
+    ({}, {'compress': 'DEFLATE', 'zlevel': 9, 'predictor': 2}),
+    # Same codec, another level
+    ({'compress': 'deflate', 'level': 6}, {'compress': 'DEFLATE', 'zlevel': 6, 'predictor': 2}),
+    ({'predictor': 3}, {'compress': 'DEFLATE', 'zlevel': 9, 'predictor': 3}),
+    # Another codec does not take the product level
+    ({'compress': 'ZSTD'}, {'compress': 'ZSTD', 'predictor': 2}),
+    ({'compress': 'ZSTD', 'level': 15}, {'compress': 'ZSTD', 'zstd_level': 15, 'predictor': 2}),
+    ({'compress': 'LERC_ZSTD', 'max_z_error': 0.01},
+     {'compress': 'LERC_ZSTD', 'max_z_error': 0.01}),
+    ({'compress': 'LERC', 'level': 0.5}, {'compress': 'LERC', 'max_z_error': 0.5}),
+])
+def test_band_codec(band_codec, options):
+    assert cogeo.compression_options(**cogeo.merge_codecs(PRODUCT_CODEC, band_codec)) == options
+
+
+def test_band_codec_errors():
+    with pytest.raises(ValueError):
+        cogeo.compression_options(**cogeo.merge_codecs(PRODUCT_CODEC, {'compress': 'PACKBITS', 'level': 1}))
+    # The product level is not carried over to a codec without levels
+    assert cogeo.compression_options(**cogeo.merge_codecs(PRODUCT_CODEC, {'compress': 'PACKBITS'})) == \
+        {'compress': 'PACKBITS'}
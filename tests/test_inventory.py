@@ -0,0 +1,25 @@
+"""
+Tests of the local SQLite index of the S3 inventory
+"""
+import os
+import sys
+from os.path import join as pjoin
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [pjoin(REPO_DIR, 'streamer'), REPO_DIR]
+
+import inventory  # noqa: E402
+
+
+def test_missing(tmp_path, monkeypatch):
+    monkeypatch.setattr(inventory, 'LOOKUP_BATCH', 2)
+    cache = inventory.InventoryCache(tmp_path / 'inventory.sqlite')
+    with cache.db:
+        cache.db.executemany('INSERT INTO object (key, date) VALUES (?, ?)',
+                             [('WOfS/x_15/y_-40/LS_WATER_1.yaml', '2019-05-20T08-00Z'),
+                              ('WOfS/x_15/y_-40/LS_WATER_3.yaml', '2019-05-20T08-00Z')])
+
+    items = [(f'LS_WATER_{i}.nc', f'WOfS/x_15/y_-40/LS_WATER_{i}') for i in range(1, 6)]
+    assert list(cache.missing(items)) == ['LS_WATER_2.nc', 'LS_WATER_4.nc', 'LS_WATER_5.nc']
+    assert list(cache.missing(items[:1], suffix='.tif')) == ['LS_WATER_1.nc']
+    cache.close()
@@ -0,0 +1,54 @@
+"""
+Tests of the completion ledger of an output directory
+"""
+import os
+import sys
+from os.path import join as pjoin
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [pjoin(REPO_DIR, 'streamer'), REPO_DIR]
+
+import ledger  # noqa: E402
+
+
+def _write(path, data):
+    with open(path, 'wb') as fd:
+        fd.write(data)
+    return str(path)
+
+
+def test_record_and_resume(tmp_path):
+    src = _write(tmp_path / 'src.nc', b'netcdf')
+    out = _write(tmp_path / 'out_1.tif', b'cog')
+    ledger.CompletionLedger(str(tmp_path)).record(out, src)
+
+    reloaded = ledger.CompletionLedger(str(tmp_path))
+    assert reloaded.is_complete(out, src)
+    assert reloaded.entries['out_1.tif']['output_md5'] is None
+
+    # A changed source invalidates the record
+    _write(tmp_path / 'src.nc', b'netcdf, version 2')
+    assert not reloaded.is_complete(out, src)
+
+
+def test_checksums_on_request(tmp_path):
+    src = _write(tmp_path / 'src.nc', b'netcdf')
+    out = _write(tmp_path / 'out_1.tif', b'cog')
+    completed = ledger.CompletionLedger(str(tmp_path), checksums=True)
+    completed.record(out, src)
+    completed.record(out, src, output_size=3, output_md5='uploaded')
+
+    assert ledger.CompletionLedger(str(tmp_path)).entries['out_1.tif']['output_md5'] == 'uploaded'
+    with open(completed.path) as fd:
+        assert '"output_md5": "01e33197684afd628ccf82a5ae4fd6ad"' in fd.readline()
+
+
+def test_one_ledger_per_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger, '_LEDGERS', {})
+    src = _write(tmp_path / 'src.nc', b'netcdf')
+    first = ledger.CompletionLedger.for_prefix(str(tmp_path / 'LS_WATER_1'))
+    first.record(_write(tmp_path / 'LS_WATER_1_water.tif', b'cog'), src)
+
+    second = ledger.CompletionLedger.for_prefix(str(tmp_path / 'LS_WATER_2'))
+    assert second is first
+    assert 'LS_WATER_1_water.tif' in second.entries
@@ -0,0 +1,42 @@
+"""
+Tests of the output prefixes made from the naming templates of a product
+"""
+import os
+import sys
+from os.path import join as pjoin
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [pjoin(REPO_DIR, 'streamer'), REPO_DIR]
+
+from naming import OutputNaming  # noqa: E402
+
+
+@pytest.mark.parametrize('src_template, dest_template, input_fname, expected', [
+    # Year
+    ('whatever_{x}_{y}_{time}', 'x_{x}/y_{y}/{year}', 'LS_WATER_3577_15_-40_20180506.nc',
+     'x_15/y_-40/2018/LS_WATER_3577_15_-40_20180506'),
+    # Year, month and day
+    ('whatever_{x}_{y}_{time}', 'x_{x}/y_{y}/{year}/{month}/{day}', 'LS_WATER_3577_15_-40_20180506012345.nc',
+     'x_15/y_-40/2018/05/06/LS_WATER_3577_15_-40_20180506012345'),
+    ('whatever_{x}_{y}_{start}_{end}', 'x_{x}/y_{y}/{year}{month}', 'LS_FC_PC_3577_15_-40_20180301_20180531.nc',
+     'x_15/y_-40/201803/LS_FC_PC_3577_15_-40_20180301_20180531'),
+    ('whatever_{x}_{y}_{time}', 'x_{x}/y_{y}/{time:%Y}/{time:%m%d}', 'LS8_OLI_FC_3577_15_-40_20180506.nc',
+     'x_15/y_-40/2018/0506/LS8_OLI_FC_3577_15_-40_20180506'),
+    # No date: only the first two directories
+    ('whatever_{x}_{y}', 'x_{x}/y_{y}/{year}', 'WOFS_3577_15_-40_summary.nc',
+     'x_15/y_-40/WOFS_3577_15_-40_summary'),
+    # Trailing versions are not numbers of the name
+    ('whatever_{x}_{y}_{time}', 'x_{x}/y_{y}/{year}', 'LS_FC_PC_3577_15_-40_2018_v1.nc',
+     'x_15/y_-40/2018/LS_FC_PC_3577_15_-40_2018_v1'),
+    ('whatever_{x}_{y}_{time}', 'x_{x}/y_{y}/{year}', 'LS_FC_PC_3577_15_-40_2018_v20180101.nc',
+     'x_15/y_-40/2018/LS_FC_PC_3577_15_-40_2018_v20180101'),
+])
+def test_prefix(tmp_path, src_template, dest_template, input_fname, expected):
+    naming = OutputNaming(src_template, dest_template)
+
+    prefix = naming.prefix(pjoin('/g/data', input_fname), str(tmp_path))
+
+    assert prefix == str(tmp_path / expected)
+    assert os.path.isdir(os.path.dirname(prefix))
@@ -0,0 +1,74 @@
+"""
+Tests of the task ordering and the packing of PBS jobs from task costs
+"""
+import os
+import sys
+from os.path import join as pjoin
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [pjoin(REPO_DIR, 'streamer'), REPO_DIR]
+
+import scheduling  # noqa: E402
+
+
+def test_lpt_order():
+    assert scheduling.lpt_order([3, 9, 1, 9, 4]) == [1, 3, 4, 0, 2]
+
+
+def test_lpt_makespan():
+    # A large task dispatched last is left to a single worker
+    costs = [1, 1, 1, 1, 1, 1, 6]
+    fifo = scheduling.predict_makespan(costs, 3)
+    lpt = scheduling.predict_makespan([costs[k] for k in scheduling.lpt_order(costs)], 3)
+
+    assert fifo == 8
+    assert lpt == 6
+    assert scheduling.predict_makespan(costs, 0) == sum(costs)
+    assert scheduling.predict_makespan([], 4) == 0
+
+
+def test_job_capacity():
+    assert scheduling.walltime_hours('1:30:00') == 1.5
+    assert scheduling.walltime_hours('0:00:36') == 0.01
+    # One CPU runs the MPI master
+    assert scheduling.job_capacity(100, 17, '2:00:00', fill=0.5) == 1600
+    assert scheduling.job_capacity(100, 1, '1:00:00') == 100
+
+
+@pytest.mark.parametrize('costs, capacity, num_chunks', [
+    ([5, 4, 3, 3, 2, 2, 1], 10, 2),
+    ([6, 6, 6], 10, 3),
+    ([7, 6, 6, 1], 10, 3),
+    ([3, 2, 2, 1], 100, 1),
+])
+def test_pack_chunks_within_capacity(costs, capacity, num_chunks):
+    chunks = scheduling.pack_chunks(costs, capacity)
+
+    assert len(chunks) == num_chunks
+    assert sorted(k for chunk in chunks for k in chunk) == list(range(len(costs)))
+    assert all(sum(costs[k] for k in chunk) <= capacity for chunk in chunks)
+    for chunk in chunks:
+        assert [costs[k] for k in chunk] == sorted((costs[k] for k in chunk), reverse=True)
+
+
+def test_pack_chunks_over_capacity():
+    # A task over the capacity gets a job of its own
+    chunks = scheduling.pack_chunks([50, 2, 3], 10)
+    assert chunks == [[0], [2, 1]]
+
+    assert scheduling.pack_chunks([4, 5], 0) == [[1, 0]]
+    assert scheduling.pack_chunks([], 10) == [[]]
+
+
+def test_pack_chunks_for_walltime():
+    capacity = scheduling.job_capacity(throughput=10, ncpus=5, walltime='1:00:00', fill=0.8)
+    costs = [20] * 7 + [5] * 4
+
+    chunks = scheduling.pack_chunks(costs, capacity)
+
+    # No two of the large tasks fit in a job
+    assert capacity == 32
+    assert len(chunks) == 7
+    assert max(sum(costs[k] for k in chunk) for chunk in chunks) <= 32
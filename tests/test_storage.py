@@ -0,0 +1,61 @@
+"""
+Tests of the S3 output storage against a mocked S3
+"""
+import hashlib
+import io
+import os
+import sys
+from os.path import join as pjoin
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [pjoin(REPO_DIR, 'streamer'), REPO_DIR]
+
+import storage  # noqa: E402
+
+BUCKET = 'dea-public-data'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        monkeypatch.setenv(name, 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    # The smallest part size S3 takes, so that a few MiB are uploaded in parts
+    monkeypatch.setattr(storage, 'MULTIPART_CHUNKSIZE', 5 * 1024 ** 2)
+    storage._client.cache_clear()
+    with moto.mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+    storage._client.cache_clear()
+
+
+def test_key():
+    s3_storage = storage.S3Storage(BUCKET, '/WOfS/WOFLs/v2.1.5/combined/')
+
+    assert (s3_storage.key('/g/data/out/x_9/y_-39/2018/LS_WATER.tif', '/g/data/out') ==
+            'WOfS/WOFLs/v2.1.5/combined/x_9/y_-39/2018/LS_WATER.tif')
+    assert storage.S3Storage(BUCKET).key('/out/x_9/LS_WATER.yaml', '/out') == 'x_9/LS_WATER.yaml'
+
+
+@pytest.mark.parametrize('nbytes', [1000, 12 * 1024 ** 2])
+def test_upload(s3, nbytes):
+    s3_storage = storage.S3Storage(BUCKET, 'WOfS')
+    data = os.urandom(nbytes)
+
+    size, md5 = s3_storage.upload(io.BytesIO(data), 'WOfS/x_9/LS_WATER.tif', 'image/tiff')
+
+    assert (size, md5) == (nbytes, hashlib.md5(data).hexdigest())
+    stored = s3.get_object(Bucket=BUCKET, Key='WOfS/x_9/LS_WATER.tif')
+    assert stored['ContentType'] == 'image/tiff'
+    assert stored['Body'].read() == data
+    assert s3_storage.size('WOfS/x_9/LS_WATER.tif') == nbytes
+
+
+def test_size_of_missing_object(s3):
+    assert storage.S3Storage(BUCKET).size('x_9/missing.tif') is None
@@ -0,0 +1,123 @@
+"""
+Tests of the header-only COG validator on TIFF and BigTIFF files built by hand, in both byte orders
+"""
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import validate_cog_header  # noqa: E402
+
+SHORT = 3
+LONG = 4
+LONG8 = 16
+
+TILE = 256
+TILE_BYTES = 16
+
+
+def _ifd(endian, bigtiff, tags, next_offset):
+    """
+    Encode an IFD of (tag, field type, value) entries, values inline
+    """
+    if bigtiff:
+        count_fmt, entry_fmt, next_fmt, inline_size = 'Q', 'HHQ', 'Q', 8
+    else:
+        count_fmt, entry_fmt, next_fmt, inline_size = 'H', 'HHI', 'I', 4
+    data = struct.pack(endian + count_fmt, len(tags))
+    for tag, field_type, value in sorted(tags):
+        fmt = {SHORT: 'H', LONG: 'I', LONG8: 'Q'}[field_type]
+        inline = struct.pack(endian + fmt, value).ljust(inline_size, b'\0')
+        data += struct.pack(endian + entry_fmt, tag, field_type, 1) + inline
+    return data + struct.pack(endian + next_fmt, next_offset)
+
+
+def _ifd_size(bigtiff, num_tags):
+    return 8 + 20 * num_tags + 8 if bigtiff else 2 + 12 * num_tags + 4
+
+
+def build_tiff(endian, bigtiff, sizes, overviews_first=True):
+    """
+    Build a tiled TIFF with a main image and overviews of the given sizes, one tile each
+
+    The IFDs follow the header; the tiles come after, smallest overview first unless not 'overviews_first'.
+    """
+    if bigtiff:
+        header = (b'II' if endian == '<' else b'MM') + struct.pack(endian + 'HHHQ', 43, 8, 0, 16)
+        offset_type = LONG8
+    else:
+        header = (b'II' if endian == '<' else b'MM') + struct.pack(endian + 'HI', 42, 8)
+        offset_type = LONG
+    num_tags = 6
+    ifd_offsets = [len(header) + k * _ifd_size(bigtiff, num_tags) for k in range(len(sizes))]
+    data_start = ifd_offsets[-1] + _ifd_size(bigtiff, num_tags)
+    order = list(reversed(range(len(sizes)))) if overviews_first else list(range(len(sizes)))
+    tile_offsets = {k: data_start + position * TILE_BYTES for position, k in enumerate(order)}
+
+    body = header
+    for k, (width, height) in enumerate(sizes):
+        next_offset = ifd_offsets[k + 1] if k + 1 < len(sizes) else 0
+        tags = [(validate_cog_header.NEW_SUBFILE_TYPE, LONG, 1 if k else 0),
+                (validate_cog_header.IMAGE_WIDTH, LONG, width),
+                (validate_cog_header.IMAGE_LENGTH, LONG, height),
+                (validate_cog_header.TILE_WIDTH, SHORT, TILE),
+                (validate_cog_header.TILE_LENGTH, SHORT, TILE),
+                (validate_cog_header.TILE_OFFSETS, offset_type, tile_offsets[k])]
+        body += _ifd(endian, bigtiff, tags, next_offset)
+    return body + b'\0' * TILE_BYTES * len(sizes), ifd_offsets, tile_offsets
+
+
+LAYOUTS = [pytest.param(endian, bigtiff, id='{}-{}'.format('big' if bigtiff else 'classic',
+                                                            'le' if endian == '<' else 'be'))
+           for bigtiff in (False, True) for endian in ('<', '>')]
+
+
+@pytest.mark.parametrize('endian, bigtiff', LAYOUTS)
+def test_valid_cog(tmp_path, endian, bigtiff):
+    data, ifd_offsets, tile_offsets = build_tiff(endian, bigtiff, [(1024, 1024), (512, 512), (256, 256)])
+    fname = tmp_path / 'cog.tif'
+    fname.write_bytes(data)
+
+    errors, details = validate_cog_header.validate(str(fname))
+
+    assert errors == []
+    assert details['ifd_offsets'] == {'main': ifd_offsets[0],
+                                      'overview_0': ifd_offsets[1],
+                                      'overview_1': ifd_offsets[2]}
+    assert details['data_offsets'] == {'main': tile_offsets[0],
+                                       'overview_0': tile_offsets[1],
+                                       'overview_1': tile_offsets[2]}
+
+
+@pytest.mark.parametrize('endian, bigtiff', LAYOUTS)
+def test_main_image_data_first(tmp_path, endian, bigtiff):
+    data, _, _ = build_tiff(endian, bigtiff, [(1024, 1024), (512, 512)], overviews_first=False)
+    fname = tmp_path / 'not_cog.tif'
+    fname.write_bytes(data)
+
+    errors, _ = validate_cog_header.validate(str(fname))
+
+    assert len(errors) == 1
+    assert errors[0].startswith('The offset of the first block of the main resolution image')
+
+
+@pytest.mark.parametrize('endian, bigtiff', LAYOUTS)
+def test_no_overviews(tmp_path, endian, bigtiff):
+    data, _, _ = build_tiff(endian, bigtiff, [(1024, 1024)])
+    fname = tmp_path / 'no_overviews.tif'
+    fname.write_bytes(data)
+
+    errors, _ = validate_cog_header.validate(str(fname))
+
+    assert errors == ['The file is greater than 512xH or Wx512, but has no overviews']
+
+
+def test_not_a_tiff(tmp_path):
+    fname = tmp_path / 'not_a_tiff.tif'
+    fname.write_bytes(b'GIF89a')
+
+    with pytest.raises(validate_cog_header.ValidateCloudOptimizedGeoTIFFException):
+        validate_cog_header.validate(str(fname))
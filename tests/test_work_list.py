@@ -0,0 +1,116 @@
+"""
+Tests of the dataset listing of work_list.py against a stubbed index engine
+"""
+import importlib
+import os
+import sys
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+pytest.importorskip('datacube')
+pytest.importorskip('dea.aws')
+
+Row = namedtuple('Row', ['uri', 'll_x', 'll_y', 'from_dt', 'to_dt'])
+AddedRow = namedtuple('AddedRow', Row._fields + ('added',))
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def fetchmany(self, size):
+        page, self.rows = self.rows[:size], self.rows[size:]
+        return page
+
+
+class _Connection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execution_options(self, **options):
+        self.engine.options = options
+        return self
+
+    def execute(self, query, params):
+        self.engine.queries.append((str(query), params))
+        return _Result(self.engine.rows)
+
+
+class _Engine:
+    """
+    Engine answering every query with the same rows
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self.options = None
+        self.connect_args = None
+
+    @contextmanager
+    def connect(self):
+        yield _Connection(self)
+
+
+@pytest.fixture
+def work_list(monkeypatch):
+    # The product configuration is read from the working directory on import
+    monkeypatch.chdir(REPO_DIR)
+    return importlib.import_module('work_list')
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    index_query = importlib.import_module('streamer.index_query')
+    engine = _Engine([
+        Row('file:///g/data/LS_WATER_3577_15_-40_20180506.nc#part=0', 1500000.0, -4000000.0,
+            datetime(2018, 5, 6, 1), datetime(2018, 5, 6, 3)),
+        Row('file:///g/data/LS_WATER_3577_15_-40_20180522.nc#part=0', 1500000.0, -4000000.0,
+            datetime(2018, 5, 22, 1), datetime(2018, 5, 22, 1)),
+    ])
+    config = {'db_database': 'datacube', 'db_hostname': 'db.example', 'db_port': '5432', 'db_username': 'user'}
+    monkeypatch.setattr(index_query.LocalConfig, 'find', staticmethod(lambda env=None: config))
+
+    def create_engine(url, connect_args=None):
+        engine.connect_args = connect_args
+        return engine
+
+    monkeypatch.setattr(index_query, 'create_engine', create_engine)
+    return engine
+
+
+def test_get_dataset_values(work_list, engine):
+    values = list(work_list.get_dataset_values('wofs_albers', year=2018, month=5, datacube_env='dea-prod'))
+
+    assert values == [
+        ('/g/data/LS_WATER_3577_15_-40_20180506.nc#part=0',
+         'WOfS/WOFLs/v2.1.5/combined/x_15/y_-40/LS_WATER_3577_15_-40_2018-05-06'),
+        ('/g/data/LS_WATER_3577_15_-40_20180522.nc#part=0',
+         'WOfS/WOFLs/v2.1.5/combined/x_15/y_-40/LS_WATER_3577_15_-40_2018-05-22'),
+    ]
+    (query, params), = engine.queries
+    assert params == {'product': 'wofs_albers', 'start': datetime(2018, 5, 1), 'end': datetime(2018, 6, 1)}
+    assert 'AS ll_x' in query and 'AS from_dt' in query and 'AS lat_begin' not in query
+    assert engine.options == {'stream_results': True}
+    assert engine.connect_args['dbname'] == 'datacube'
+    assert engine.connect_args['host'] == 'db.example'
+
+
+def test_get_dataset_values_since_watermark(work_list, engine, tmp_path):
+    watermark_module = importlib.import_module('streamer.watermark')
+    added = datetime(2018, 6, 1, 12)
+    engine.rows = [AddedRow(*row, added) for row in engine.rows]
+    watermark = watermark_module.Watermark('wofs_albers', tmp_path)
+
+    values = list(work_list.get_dataset_values('wofs_albers', watermark=watermark))
+
+    assert len(values) == 2
+    (query, params), = engine.queries
+    assert params == {'product': 'wofs_albers', 'since': watermark_module.EPOCH}
+    assert watermark.indexed_until == added
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""
+Validate the Cloud Optimized GeoTIFF layout of files by parsing their TIFF headers.
+
+This checks the same rules as validate_cloud_optimized_geotiff.py (IFD ordering,
+overview ordering, tiling and data offset ordering) and reports the same
+errors/details structure, but reads the TIFF/BigTIFF IFD chain directly with
+mmap instead of opening each file through GDAL. Only the pages holding the
+IFDs and the first tile offsets are touched, which for a COG is the first few
+KB of the file.
+"""
+
+import mmap
+import os
+import struct
+import sys
+
+TIFF_CLASSIC = 42
+TIFF_BIG = 43
+
+# TIFF tags used to describe the layout
+NEW_SUBFILE_TYPE = 254
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+STRIP_OFFSETS = 273
+ROWS_PER_STRIP = 278
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+
+# NewSubfileType flags
+FILETYPE_REDUCEDIMAGE = 0x1
+FILETYPE_MASK = 0x4
+
+# Struct format and size of each TIFF field type
+FIELD_TYPES = {
+    1: ('B', 1), 2: ('c', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8),
+    6: ('b', 1), 7: ('B', 1), 8: ('h', 2), 9: ('i', 4), 10: ('ii', 8),
+    11: ('f', 4), 12: ('d', 8), 13: ('I', 4), 16: ('Q', 8), 17: ('q', 8), 18: ('Q', 8),
+}
+
+
+def Usage():
+    print('Usage: validate_cog_header.py [-q] test.tif [test2.tif ...]')
+    print('')
+    return 1
+
+
+class ValidateCloudOptimizedGeoTIFFException(Exception):
+    pass
+
+
+class _TiffReader(object):
+    """Read the IFD chain of a TIFF or BigTIFF file from a buffer."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        try:
+            byte_order = bytes(buf[0:2])
+        except (IndexError, TypeError):
+            byte_order = b''
+        if byte_order == b'II':
+            self.endian = '<'
+        elif byte_order == b'MM':
+            self.endian = '>'
+        else:
+            raise ValidateCloudOptimizedGeoTIFFException('The file is not a GeoTIFF')
+
+        version = self.unpack('H', 2)[0]
+        if version == TIFF_CLASSIC:
+            self.bigtiff = False
+            self.first_ifd = self.unpack('I', 4)[0]
+        elif version == TIFF_BIG:
+            self.bigtiff = True
+            self.first_ifd = self.unpack('Q', 8)[0]
+        else:
+            raise ValidateCloudOptimizedGeoTIFFException('The file is not a GeoTIFF')
+
+    def unpack(self, fmt, offset):
+        try:
+            return struct.unpack_from(self.endian + fmt, self.buf, offset)
+        except struct.error:
+            raise ValidateCloudOptimizedGeoTIFFException(
+                'Invalid file : truncated TIFF structure at byte %d' % offset)
+
+    def read_ifd(self, offset):
+        """Return the tags of the IFD at 'offset' and the offset of the next IFD."""
+        if self.bigtiff:
+            count_fmt, entry_size, entry_fmt, next_fmt, inline_size = 'Q', 20, 'HHQ', 'Q', 8
+        else:
+            count_fmt, entry_size, entry_fmt, next_fmt, inline_size = 'H', 12, 'HHI', 'I', 4
+        count = self.unpack(count_fmt, offset)[0]
+        entries_offset = offset + struct.calcsize(self.endian + count_fmt)
+
+        tags = {}
+        for i in range(count):
+            entry_offset = entries_offset + i * entry_size
+            tag, field_type, value_count = self.unpack(entry_fmt, entry_offset)
+            # With an explicit byte order, sizes are standard: no alignment padding before the 'Q' of BigTIFF
+            value_offset = entry_offset + struct.calcsize(self.endian + entry_fmt)
+            if field_type not in FIELD_TYPES or value_count == 0:
+                continue
+            fmt, size = FIELD_TYPES[field_type]
+            if size * value_count > inline_size:
+                value_offset = self.unpack(next_fmt, value_offset)[0]
+            # Only the first value is needed: a dimension, a flag or the offset of block 0
+            tags[tag] = self.unpack(fmt, value_offset)[0]
+
+        next_offset = self.unpack(next_fmt, entries_offset + count * entry_size)[0]
+        return tags, next_offset
+
+    def ifds(self):
+        """Yield (ifd_offset, tags) for each IFD of the chain."""
+        offset = self.first_ifd
+        seen = set()
+        while offset != 0 and offset not in seen:
+            seen.add(offset)
+            tags, next_offset = self.read_ifd(offset)
+            yield offset, tags
+            offset = next_offset
+
+
+class _Image(object):
+    """Layout of the main image or of an overview, as needed by the COG checks."""
+
+    def __init__(self, ifd_offset, tags):
+        self.ifd_offset = ifd_offset
+        self.XSize = tags.get(IMAGE_WIDTH, 0)
+        self.YSize = tags.get(IMAGE_LENGTH, 0)
+        if TILE_WIDTH in tags:
+            self.block_size = [tags[TILE_WIDTH], tags.get(TILE_LENGTH, 0)]
+            block_offset = tags.get(TILE_OFFSETS)
+        else:
+            self.block_size = [self.XSize, min(tags.get(ROWS_PER_STRIP, self.YSize), self.YSize)]
+            block_offset = tags.get(STRIP_OFFSETS)
+        # Like GDAL, an offset of 0 (a sparse block) means there is no block
+        self.block_offset = block_offset or None
+
+    def is_untiled(self):
+        return self.block_size[0] == self.XSize and self.block_size[0] > 1024
+
+
+def read_layout(buf):
+    """
+    Return the main image and the overviews of the TIFF held in 'buf'.
+
+    Mask IFDs are skipped, and overviews are listed in file order, as GDAL does.
+    """
+    reader = _TiffReader(buf)
+    main = None
+    overviews = []
+    for ifd_offset, tags in reader.ifds():
+        subfile_type = tags.get(NEW_SUBFILE_TYPE, 0)
+        if subfile_type & FILETYPE_MASK:
+            continue
+        if main is None:
+            main = _Image(ifd_offset, tags)
+        elif subfile_type & FILETYPE_REDUCEDIMAGE:
+            overviews.append(_Image(ifd_offset, tags))
+    if main is None:
+        raise ValidateCloudOptimizedGeoTIFFException('Invalid file : no image found')
+    return main, overviews
+
+
+def _check_layout(filename, main, overviews, check_tiled=True):
+    details = {}
+    errors = []
+    ovr_count = len(overviews)
+    if os.path.exists(filename + '.ovr'):
+        errors += [
+            'Overviews found in external .ovr file. They should be internal']
+
+    if main.XSize >= 512 or main.YSize >= 512:
+        if check_tiled:
+            if main.is_untiled():
+                errors += [
+                    'The file is greater than 512xH or Wx512, but is not tiled']
+
+        if ovr_count == 0:
+            errors += [
+                'The file is greater than 512xH or Wx512, but has no overviews']
+
+    ifd_offset = main.ifd_offset
+    ifd_offsets = [ifd_offset]
+    if ifd_offset not in (8, 16):
+        errors += [
+            'The offset of the main IFD should be 8 for ClassicTIFF '
+            'or 16 for BigTIFF. It is %d instead' % ifd_offsets[0]]
+    details['ifd_offsets'] = {}
+    details['ifd_offsets']['main'] = ifd_offset
+
+    for i, ovr in enumerate(overviews):
+        # Check that overviews are by descending sizes
+        if i == 0:
+            if ovr.XSize > main.XSize or ovr.YSize > main.YSize:
+                errors += [
+                    'First overview has larger dimension than main band']
+        else:
+            prev_ovr = overviews[i - 1]
+            if ovr.XSize > prev_ovr.XSize or ovr.YSize > prev_ovr.YSize:
+                errors += [
+                    'Overview of index %d has larger dimension than '
+                    'overview of index %d' % (i, i - 1)]
+
+        if check_tiled:
+            if ovr.is_untiled():
+                errors += [
+                    'Overview of index %d is not tiled' % i]
+
+        # Check that the IFD of descending overviews are sorted by increasing
+        # offsets
+        ifd_offsets.append(ovr.ifd_offset)
+        details['ifd_offsets']['overview_%d' % i] = ovr.ifd_offset
+        if ifd_offsets[-1] < ifd_offsets[-2]:
+            if i == 0:
+                errors += [
+                    'The offset of the IFD for overview of index %d is %d, '
+                    'whereas it should be greater than the one of the main '
+                    'image, which is at byte %d' %
+                    (i, ifd_offsets[-1], ifd_offsets[-2])]
+            else:
+                errors += [
+                    'The offset of the IFD for overview of index %d is %d, '
+                    'whereas it should be greater than the one of index %d, '
+                    'which is at byte %d' %
+                    (i, ifd_offsets[-1], i - 1, ifd_offsets[-2])]
+
+    # Check that the imagery starts by the smallest overview and ends with
+    # the main resolution dataset
+    if main.block_offset is None:
+        errors += ['Missing BLOCK_OFFSET_0_0']
+    data_offsets = [main.block_offset]
+    details['data_offsets'] = {}
+    details['data_offsets']['main'] = main.block_offset
+    for i, ovr in enumerate(overviews):
+        if ovr.block_offset is None:
+            errors += ['Missing BLOCK_OFFSET_0_0 for overview of index %d' % i]
+        data_offsets.append(ovr.block_offset)
+        details['data_offsets']['overview_%d' % i] = ovr.block_offset
+
+    if None in data_offsets:
+        # The ordering can't be checked without the offsets
+        return errors, details
+
+    if data_offsets[-1] < ifd_offsets[-1]:
+        if ovr_count > 0:
+            errors += [
+                'The offset of the first block of the smallest overview '
+                'should be after its IFD']
+        else:
+            errors += [
+                'The offset of the first block of the image should '
+                'be after its IFD']
+    for i in range(len(data_offsets) - 2, 0, -1):
+        if data_offsets[i] < data_offsets[i + 1]:
+            errors += [
+                'The offset of the first block of overview of index %d should '
+                'be after the one of the overview of index %d' %
+                (i - 1, i)]
+    if len(data_offsets) >= 2 and data_offsets[0] < data_offsets[1]:
+        errors += [
+            'The offset of the first block of the main resolution image'
+            'should be after the one of the overview of index %d' %
+            (ovr_count - 1)]
+
+    return errors, details
+
+
+def validate(filename, check_tiled=True):
+    """Check if a file is a (Geo)TIFF with cloud optimized compatible structure.
+
+    Args:
+      filename: Path of the file to inspect.
+      check_tiled: Set to False to ignore missing tiling.
+
+    Returns:
+      A tuple, whose first element is an array of error messages
+      (empty if there is no error), and the second element, a dictionary
+      with the structure of the GeoTIFF file.
+
+    Raises:
+      ValidateCloudOptimizedGeoTIFFException: Unable to open the file or the
+        file is not a Tiff.
+    """
+    try:
+        with open(filename, 'rb') as fd:
+            try:
+                buf = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                raise ValidateCloudOptimizedGeoTIFFException('The file is not a GeoTIFF')
+            try:
+                main, overviews = read_layout(buf)
+            finally:
+                buf.close()
+    except OSError as e:
+        raise ValidateCloudOptimizedGeoTIFFException('Invalid file : %s' % e)
+
+    return _check_layout(filename, main, overviews, check_tiled)
+
+
+def validate_many(filenames, check_tiled=True):
+    """Validate several files.
+
+    Yields:
+      A (filename, errors, details) tuple per file. Files which can't be
+      parsed are reported with their exception message as the only error
+      and empty details.
+    """
+    for filename in filenames:
+        try:
+            errors, details = validate(filename, check_tiled)
+        except ValidateCloudOptimizedGeoTIFFException as e:
+            errors, details = [str(e)], {}
+        yield filename, errors, details
+
+
+def main():
+    """Return 0 if all the files are valid, 1 otherwise."""
+
+    filenames = []
+    quiet = False
+    for arg in sys.argv[1:]:
+        if arg == '-q':
+            quiet = True
+        elif arg[0] == '-':
+            return Usage()
+        else:
+            filenames.append(arg)
+
+    if not filenames:
+        return Usage()
+
+    ret = 0
+    for filename, errors, _ in validate_many(filenames):
+        if errors:
+            if not quiet:
+                print('%s is NOT a valid cloud optimized GeoTIFF.' % filename)
+                print('The following errors were found:')
+                for error in errors:
+                    print(' - ' + error)
+            ret = 1
+        elif not quiet:
+            print('%s is a valid cloud optimized GeoTIFF' % filename)
+
+    return ret
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,24 +1,68 @@
-import subprocess
+import json
 import click
 import sys,os
-import logging
+import time
+from multiprocessing import Pool
+
+import validate_cog_header
+
+
+def _find_tifs(path):
+    for root, subdirs, files in os.walk(path):
+        for filename in sorted(files):
+            if filename.endswith('.tif'):
+                yield os.path.join(root, filename)
+
+
+def _verify(args):
+    """
+    Validate one GeoTIFF and return its JSON Lines record
+    """
+    file_name, use_gdal = args
+    if use_gdal:
+        # Imported once per worker process
+        import validate_cloud_optimized_geotiff as validator
+    else:
+        validator = validate_cog_header
+
+    try:
+        errors, details = validator.validate(file_name)
+    except validator.ValidateCloudOptimizedGeoTIFFException as e:
+        errors, details = [str(e)], {}
+
+    return {'path': file_name,
+            'valid': not errors,
+            'errors': errors,
+            'ifd_offsets': details.get('ifd_offsets', {}),
+            'data_offsets': details.get('data_offsets', {})}
+
 
 @click.command(help= "\b Verify the converted Geotiffs are Cloud Optimized Geotiffs."
-" Mandatory Requirement: validate_cloud_optimized_geotiff.py gdal file")
+" Results are written as JSON Lines, followed by a summary on stderr.")
 @click.option('--path', '-p', required = True, help="Read the Geotiffs from this folder",
                 type=click.Path(exists=True, readable=True))
-def main(path):
+@click.option('--workers', '-w', type=int, default=os.cpu_count(), help="Number of validating processes")
+@click.option('--output', '-o', type=click.File('w'), default='-', help="JSON Lines output file (default: stdout)")
+@click.option('--gdal', 'use_gdal', is_flag=True,
+              help="Validate through GDAL (validate_cloud_optimized_geotiff.py) instead of the TIFF headers")
+def main(path, workers, output, use_gdal):
     Gtiff_path = os.path.abspath(path)
-    count=0
-    for root, subdirs,files in os.walk(Gtiff_path):
-       for filename in files:
-          if filename.endswith('.tif'):
-              count = count+1
-              file_name =os.path.join(root,filename)
-              command = "python validate_cloud_optimized_geotiff.py " + file_name
-              output = subprocess.getoutput(command)
-              valid_output = (output.split('/'))[-1]
-              print(str(count)+":"+valid_output)
+    count = 0
+    invalid = 0
+    start = time.time()
+    tasks = ((file_name, use_gdal) for file_name in _find_tifs(Gtiff_path))
+
+    with Pool(processes=max(1, workers)) as pool:
+        for record in pool.imap(_verify, tasks, chunksize=64):
+            count = count+1
+            if not record['valid']:
+                invalid = invalid+1
+            output.write(json.dumps(record) + '\n')
+
+    elapsed = time.time() - start
+    print(f"{count} GeoTIFFs verified in {elapsed:.1f}s: {count - invalid} valid, {invalid} invalid",
+          file=sys.stderr)
+    sys.exit(1 if invalid else 0)
 
 if __name__ == "__main__":
     main()
@@ -1,15 +1,16 @@
-import re
 from datetime import datetime
 from pathlib import Path
 
 import click
 import yaml
 from dea.aws import make_s3_client
-from dea.aws.inventory import list_inventory
 from pandas import Timestamp
 
-from datacube import Datacube
 from datacube.model import Range
+from streamer.index_query import index_engine, search_datasets
+from streamer.inventory import DEFAULT_CACHE, InventoryCache
+from streamer.naming import compile_template
+from streamer.watermark import DEFAULT_DIR as WATERMARK_DIR, Watermark, scope_name
 
 with open('aws_products_config.yaml', 'r') as fd:
     CFG = yaml.load(fd)
@@ -34,65 +35,81 @@ def check_date(context, param, value):
 @click.option('--inventory-manifest', '-i',
               default='s3://dea-public-data-inventory/dea-public-data/dea-public-data-csv-inventory/',
               help="The manifest of AWS inventory list")
-def generate_work_list(product_name, year, month, from_date, output_dir, inventory_manifest):
+@click.option('--inventory-cache', type=click.Path(dir_okay=False), default=str(DEFAULT_CACHE), show_default=True,
+              help="Local index of the inventory keys, refreshed when a new manifest is published")
+@click.option('--since-last-run', is_flag=True,
+              help="Only list the datasets added to the index since the last run with this option")
+@click.option('--watermark-dir', type=click.Path(file_okay=False), default=str(WATERMARK_DIR), show_default=True,
+              help="Where the per-product watermarks of --since-last-run are kept")
+def generate_work_list(product_name, year, month, from_date, output_dir, inventory_manifest, inventory_cache,
+                       since_last_run, watermark_dir):
     """
     Connect to an ODC database and list datasets
     """
+    watermark = None
+    if since_last_run:
+        watermark = Watermark(product_name, watermark_dir, scope_name(year, month, from_date))
 
-    # Filter the inventory list to obtain yaml files corresponding to the product
-    s3_client = make_s3_client()
-    s3_yaml_keys = set(yaml_files_for_product(list_inventory(inventory_manifest, s3=s3_client), product_name))
+    # Bring the local index of the inventory yaml files up to date
+    cache = InventoryCache(inventory_cache)
+    cache.refresh(inventory_manifest, s3=make_s3_client())
 
     # We only want to process datasets that are not in AWS bucket
-    uris = [uri
-            for uri, prefix in get_dataset_values(product_name, year, month, from_date, 'dea-prod')
-            if prefix + '.yaml' not in s3_yaml_keys]
+    uris = cache.missing(get_dataset_values(product_name, year, month, from_date, 'dea-prod', watermark))
 
+    # Datasets come ordered by location, several datasets of a stacked file in a row
     out_file = Path(output_dir) / 'file_list'
     with open(out_file, 'w') as fp:
-        for item in sorted(uris):
-            fp.write(item + '\n')
+        last = None
+        for item in uris:
+            if item != last:
+                fp.write(item + '\n')
+                last = item
+    cache.close()
 
+    if watermark is not None:
+        watermark.save(out_file)
 
-def get_dataset_values(product, year=None, month=None, from_date=None, datacube_env=None):
+
+def get_dataset_values(product, year=None, month=None, from_date=None, datacube_env=None, watermark=None):
     """
-    Extract the file list corresponding to a product for the given year and month using datacube API.
+    Extract the file list corresponding to a product for the given year and month from the datacube index.
+
+    Only the fields used by the name template of the product are read, and the results are streamed in order of
+    location. With a watermark, only the datasets added to the index since the watermark are listed, and the
+    watermark is moved past them.
     """
+    product_config = CFG['products'][product]
 
-    query = {'product': product}
+    time_range = None
     if from_date:
-        query['time'] = Range(datetime(year=from_date.year, month=from_date.month, day=from_date.day),
-                              datetime.now())
+        time_range = (datetime(year=from_date.year, month=from_date.month, day=from_date.day), datetime.now())
     elif year and month:
-        query['time'] = Range(datetime(year=year, month=month, day=1), datetime(year=year, month=month + 1, day=1))
+        time_range = (datetime(year=year, month=month, day=1),
+                      datetime(year=year + month // 12, month=month % 12 + 1, day=1))
     elif year:
-        query['time'] = Range(datetime(year=year, month=1, day=1), datetime(year=year + 1, month=1, day=1))
-    dc = Datacube(app='cog-worklist query', env=datacube_env)
+        time_range = (datetime(year=year, month=1, day=1), datetime(year=year + 1, month=1, day=1))
+    engine = index_engine(datacube_env, 'cog-worklist query')
 
-    field_names = get_field_names(product)
-    files = dc.index.datasets.search_returning(field_names=tuple(field_names), **query)
+    field_names = get_field_names(product_config)
+    since = watermark.since if watermark is not None else None
+    rows = search_datasets(engine, product, field_names, time_range, since)
 
     # Extract file name from search_result
     def filename_from_uri(uri):
         return uri.split('//')[1]
 
-    for result in files:
-        yield filename_from_uri(result.uri), compute_prefix_from_query_result(result, product)
-
-
-def yaml_files_for_product(inventory_list, product):
-    """
-    Filter the given list of s3_keys to yield '.yaml' files corresponding to a product
-    """
-
-    for item in inventory_list:
-        if item.Key.startswith(CFG['products'][product]['prefix']) and Path(item.Key).suffix == '.yaml':
-            yield item.Key
+    for row in rows:
+        if watermark is not None:
+            if not watermark.is_new(row.uri, row.added):
+                continue
+            watermark.observe(row.uri, row.added)
+        yield filename_from_uri(row.uri), compute_prefix_from_query_result(row, product_config)
 
 
 def get_field_names(product_config):
     """
-    Get field names for a datacube query for a given product
+    Get the index fields to query for a given product
     """
 
     # Get parameter names
@@ -100,8 +117,10 @@ def get_field_names(product_config):
 
     # Populate field names
     field_names = ['uri']
-    if 'x' in param_names or 'y' in param_names:
-        field_names.append('metadata_doc')
+    if 'x' in param_names:
+        field_names.append('x')
+    if 'y' in param_names:
+        field_names.append('y')
     if 'time' in param_names or 'start_time' in param_names or 'end_time' in param_names:
         field_names.append('time')
     if 'lat' in param_names:
@@ -115,36 +134,35 @@ def get_param_names(template_str):
     """
     Return parameter names from a template string
     """
-    return list(set(re.findall(r'{([\w_]+)[:Ymd\-%]*}', template_str)))
+    return compile_template(template_str).fields
 
 
 def compute_prefix_from_query_result(result, product_config):
     """
-    Compute the AWS prefix for a dataset from a datacube search result
+    Compute the AWS prefix for a dataset from a row of index_query.search_datasets
     """
     params = {}
 
     # Get geo x and y values
-    if hasattr(result, 'metadata_doc'):
-        metadata = result.metadata_doc
-        geo_ref = metadata['grid_spatial']['projection']['geo_ref_points']['ll']
-        params['x'] = int(geo_ref['x'] / 100000)
-        params['y'] = int(geo_ref['y'] / 100000)
+    if hasattr(result, 'll_x'):
+        params['x'] = int(result.ll_x / 100000)
+    if hasattr(result, 'll_y'):
+        params['y'] = int(result.ll_y / 100000)
 
     # Get lat and lon values
-    if hasattr(result, 'lat'):
-        params['lat'] = result.lat
-    if hasattr(result, 'lon'):
-        params['lon'] = result.lon
+    if hasattr(result, 'lat_begin'):
+        params['lat'] = Range(result.lat_begin, result.lat_end)
+    if hasattr(result, 'lon_begin'):
+        params['lon'] = Range(result.lon_begin, result.lon_end)
 
     # Compute time values
-    if hasattr(result, 'time'):
-        mid_time = result.time.lower + (result.time.upper - result.time.lower) / 2
+    if hasattr(result, 'from_dt'):
+        mid_time = result.from_dt + (result.to_dt - result.from_dt) / 2
         params['time'] = mid_time
-        params['start_time'] = result.time.lower
-        params['end_time'] = result.time.upper
+        params['start_time'] = result.from_dt
+        params['end_time'] = result.to_dt
 
-    return product_config['prefix'] + product_config['name_template'].format(**params)
+    return product_config['prefix'] + '/' + compile_template(product_config['name_template']).format(params)
 
 
 if __name__ == '__main__':